@@ -1,6 +1,7 @@
 # shared_memory.py
 import os
 import json
+import hashlib
 import faiss
 import numpy as np
 from sentence_transformers import SentenceTransformer
@@ -36,6 +37,103 @@ def _load_config(config_path: str = "config.json") -> dict:
         return {}
 
 
+DEFAULT_EMBEDDING_MODEL = "paraphrase-multilingual-MiniLM-L12-v2"
+
+
+def resolve_embedding_model(cfg: dict, model_name: str | None = None) -> str:
+    """向量模型名稱：參數 > config.json（平鋪 / 區塊）> 預設值。產生器與管理器共用，確保向量一致。"""
+    nested = cfg.get("shared_memory") or {}
+    return (
+        model_name
+        or cfg.get("shared_memory_embedding_model")
+        or nested.get("embedding_model")
+        or DEFAULT_EMBEDDING_MODEL
+    )
+
+
+def read_memory_file(path: str) -> tuple[list, list]:
+    """讀取 shared_memories_{角色}.txt（每行 summary\tdetail），回傳 (summaries, details)。"""
+    summaries, details = [], []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if '\t' in line:
+                summary, detail = line.split('\t', 1)
+                summaries.append(summary)
+                details.append(detail)
+    return summaries, details
+
+
+# ------------------ 向量側檔（shared_memories_{角色}.vec.npz） ------------------
+def vector_sidecar_path(memory_file: str) -> str:
+    """與記憶文字檔同名的向量側檔路徑。"""
+    root, _ = os.path.splitext(memory_file)
+    return root + ".vec.npz"
+
+
+def encode_summaries(model, texts) -> np.ndarray:
+    """共同回憶摘要的唯一編碼方式（正規化後的 float32），寫入與檢索都必須走這裡。"""
+    return model.encode(
+        list(texts),
+        convert_to_numpy=True,
+        normalize_embeddings=True
+    ).astype('float32')
+
+
+def _summary_key(summary: str) -> str:
+    return hashlib.sha1(summary.encode("utf-8")).hexdigest()
+
+
+def _load_sidecar(path: str, model_name: str) -> dict:
+    """讀取側檔，回傳 {摘要雜湊: 向量}；模型不同或檔案損毀時回傳空 dict。"""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            if str(data["model"]) != model_name:
+                print(f"ℹ️ 向量側檔模型不同（{data['model']}），重新編碼")
+                return {}
+            return dict(zip(data["keys"].tolist(), data["embeddings"]))
+    except Exception as e:
+        print(f"⚠️ 無法讀取向量側檔 {path}：{e}")
+        return {}
+
+
+def _save_sidecar(path: str, model_name: str, keys, embeddings: np.ndarray):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            np.savez(f, model=np.array(model_name), keys=np.array(keys), embeddings=embeddings)
+        os.replace(tmp, path)
+    except Exception as e:
+        print(f"⚠️ 無法寫入向量側檔 {path}：{e}")
+        try:
+            os.remove(tmp)
+        except Exception:
+            pass
+
+
+def sync_vector_sidecar(model, model_name: str, summaries, path: str) -> tuple[np.ndarray, int]:
+    """
+    依 summaries 的順序取回向量：側檔已有的直接用，缺的才編碼，並在有變動時寫回側檔。
+    回傳 (向量矩陣, 本次新編碼筆數)。
+    """
+    if not summaries:
+        return np.zeros((0, 0), dtype='float32'), 0
+    cached = _load_sidecar(path, model_name)
+    keys = [_summary_key(s) for s in summaries]
+    missing = [i for i, k in enumerate(keys) if k not in cached]
+    if missing:
+        fresh = encode_summaries(model, [summaries[i] for i in missing])
+        for i, vec in zip(missing, fresh):
+            cached[keys[i]] = vec
+    embeddings = np.stack([cached[k] for k in keys]).astype('float32')
+    if missing or len(cached) != len(set(keys)):
+        uniq = list(dict.fromkeys(keys))
+        _save_sidecar(path, model_name, uniq, np.stack([cached[k] for k in uniq]))
+    return embeddings, len(missing)
+
+
 class SharedMemoryManager:
     def __init__(
         self,
@@ -64,12 +162,7 @@ class SharedMemoryManager:
             or nested.get("base_dir")
             or "shared_memories"
         )
-        cfg_model_name = (
-            model_name
-            or cfg.get("shared_memory_embedding_model")
-            or nested.get("embedding_model")
-            or "paraphrase-multilingual-MiniLM-L12-v2"
-        )
+        cfg_model_name = resolve_embedding_model(cfg, model_name)
         cfg_embedding_dim = int(
             embedding_dim
             or cfg.get("shared_memory_embedding_dim")
@@ -83,6 +176,8 @@ class SharedMemoryManager:
         self.base_dir = cfg_base_dir
         self.memory_file = os.path.join(self.base_dir, f"shared_memories_{character}.txt")
         self.index_file = os.path.join(self.base_dir, f"shared_faiss_{character}.idx")
+        self.vector_file = vector_sidecar_path(self.memory_file)
+        self.model_name = cfg_model_name
         self.openai_key = openai_key or cfg_openai_key or os.getenv("OPENAI_API_KEY")
 
         os.makedirs(self.base_dir, exist_ok=True)
@@ -105,23 +200,15 @@ class SharedMemoryManager:
             print("ℹ️ 無共同記憶檔案，初始化空記憶庫")
             return
 
-        with open(self.memory_file, 'r', encoding='utf-8') as f:
-            lines = [line.strip() for line in f if line.strip()]
-
-        for line in lines:
-            if '\t' in line:
-                summary, detail = line.split('\t', 1)
-                self.summaries.append(summary)
-                self.full_texts.append(detail)
+        self.summaries, self.full_texts = read_memory_file(self.memory_file)
 
         if self.summaries:
-            embeddings = self.model.encode(
-                self.summaries,
-                convert_to_numpy=True,
-                normalize_embeddings=True
-            ).astype('float32')
+            # 優先使用離線產生的向量側檔，只編碼側檔裡沒有的摘要
+            embeddings, n_new = sync_vector_sidecar(
+                self.model, self.model_name, self.summaries, self.vector_file
+            )
             self.index.add(embeddings)
-            print(f"✅ 載入 {len(self.summaries)} 筆共同回憶")
+            print(f"✅ 載入 {len(self.summaries)} 筆共同回憶（新編碼 {n_new} 筆）")
 
     def add_memory(self, summary, full_text):
         if summary in self.summaries:
@@ -129,10 +216,7 @@ class SharedMemoryManager:
             return
         self.summaries.append(summary)
         self.full_texts.append(full_text)
-        embedding = self.model.encode(
-            [summary], convert_to_numpy=True,
-            normalize_embeddings=True
-        ).astype('float32')
+        embedding = encode_summaries(self.model, [summary])
         self.index.add(embedding)
         with open(self.memory_file, 'a', encoding='utf-8') as f:
             f.write(f"{summary}\t{full_text}\n")
@@ -142,10 +226,7 @@ class SharedMemoryManager:
     def search_memories(self, query, k=3):
         if not self.summaries:
             return [], None, []
-        embedding = self.model.encode(
-            [query], convert_to_numpy=True,
-            normalize_embeddings=True
-        ).astype('float32')
+        embedding = encode_summaries(self.model, [query])
         distances, indices = self.index.search(embedding, min(k, len(self.summaries)))
         results = [
             {"brief": self.summaries[i], "detail": self.full_texts[i], "distance": float(d)}
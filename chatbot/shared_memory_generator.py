@@ -1,17 +1,28 @@
 # -*- coding: utf-8 -*-
 """
 共同回憶整理工具（CLI 版，無 GUI）
-- 讀取一個 {角色名}.txt（每行 = 一段共同回憶）
-- 以 OpenAI GPT 逐段濃縮（若有 API key），保留日期、不重複
+- 讀取一個 {角色名}.txt（每行 = 一段共同回憶），以串流方式逐行讀取，記憶體用量不隨檔案大小成長
+- 以 OpenAI GPT 分批逐段濃縮（若有 API key），保留日期、不重複
 - 追加寫入到 shared_memories/shared_memories_{角色名}.txt
-- 也提供 process_file(input_path) 供他系統程式化呼叫
+- 送 LLM 前先在本地濾掉貼圖/語助詞/系統訊息等低資訊行，並把相鄰聊天訊息合併成對話視窗
+- 已濃縮過的批次結果以內容雜湊快取在磁碟，重跑/重疊的匯出檔不會重送 LLM
+- 寫檔後同步更新向量側檔（shared_memories_{角色名}.vec.npz），聊天端 /use 時不必再編碼
+- --input-dir 批次模式：同一個行程內以執行緒池平行處理多個角色檔（共用 OpenAI client 與速率限制）
+- 也提供 process_file(input_path) / process_dir(input_dir) 供他系統程式化呼叫
 """
 import os
 import re
 import json
+import time
+import zlib
+import codecs
+import shutil
+import hashlib
 import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-from typing import List, Tuple
+from typing import Iterable, Iterator, List, Optional, Set, Tuple
 from pathlib import Path
 from datetime import datetime
 
@@ -26,9 +37,35 @@ MODEL_NAME = CONFIG.get("model_name", "gpt-4.1-nano")
 OPENAI_API_KEY = (CONFIG.get("openai_api_key") or "").strip() if CONFIG else ""
 AVOID_DUP_IN_FILE = bool(CONFIG.get("avoid_duplicates_in_file", True)) if CONFIG else True
 
+# 串流讀取：以檔頭取樣判斷編碼；濃縮時每批最多幾行 / 幾字
+ENCODING_CANDIDATES = ("utf-8", "utf-8-sig", "cp950", "big5", "utf-16")
+ENCODING_SNIFF_BYTES = int(CONFIG.get("encoding_sniff_bytes", 64 * 1024))
+CHUNK_MAX_LINES = int(CONFIG.get("condense_chunk_lines", 40))
+CHUNK_MAX_CHARS = int(CONFIG.get("condense_chunk_chars", 4000))
+# 依內容切批：行雜湊 % CHUNK_CUT_DIVISOR == 0 且批內已有 CHUNK_MIN_LINES 行時切開，
+# 讓前面多/少幾行的重疊匯出檔仍能切出相同的批次（快取才會命中）
+CHUNK_MIN_LINES = int(CONFIG.get("condense_chunk_min_lines", 8))
+CHUNK_CUT_DIVISOR = int(CONFIG.get("condense_chunk_cut_divisor", 16))
+
 BASE_DIR = Path(__file__).resolve().parent
 SHARED_DIR = BASE_DIR / "shared_memories"
 SHARED_DIR.mkdir(parents=True, exist_ok=True)
+CACHE_ENABLED = bool(CONFIG.get("condense_cache", True))
+CACHE_DIR = Path(CONFIG.get("condense_cache_dir") or (BASE_DIR / "cache" / "condense"))
+
+# 批次模式：平行處理的檔案數；OpenAI 每秒請求上限（0 = 不限制，所有執行緒共用）
+BATCH_WORKERS = int(CONFIG.get("batch_workers", 4))
+OPENAI_MAX_RPS = float(CONFIG.get("openai_max_rps", 0))
+
+# 本地預篩：低資訊行門檻、停用語（可在 config.json 追加）、對話視窗大小
+PREFILTER_ENABLED = bool(CONFIG.get("prefilter", True))
+PREFILTER_MIN_CHARS = int(CONFIG.get("prefilter_min_chars", 2))
+PREFILTER_EXTRA_STOP = list(CONFIG.get("prefilter_stop_phrases") or [])
+WINDOW_MAX_MSGS = int(CONFIG.get("dialogue_window_msgs", 8))
+WINDOW_MAX_CHARS = int(CONFIG.get("dialogue_window_chars", 240))
+
+# 寫檔後順便產生向量側檔（與 SharedMemoryManager 使用相同模型與正規化）
+EMBED_ON_WRITE = bool(CONFIG.get("embed_on_write", True))
 
 # ===================== OpenAI（可選） =====================
 USE_OPENAI = False
@@ -40,6 +77,25 @@ try:
 except Exception:
     USE_OPENAI = False
 
+class RateLimiter:
+    """簡單的最小間隔限速器，多執行緒共用同一個實例即可共用額度。"""
+    def __init__(self, max_per_sec: float = 0.0):
+        self.interval = 1.0 / max_per_sec if max_per_sec > 0 else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if self.interval <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            at = max(now, self._next)
+            self._next = at + self.interval
+        if at > now:
+            time.sleep(at - now)
+
+RATE_LIMITER = RateLimiter(OPENAI_MAX_RPS)
+
 # ===================== 資料模型 =====================
 @dataclass
 class MemoryItem:
@@ -59,6 +115,187 @@ def extract_dates(s: str) -> List[str]:
             dates.add(m.group(0))
     return sorted(dates)
 
+# ===================== 串流讀取 =====================
+def detect_encoding(path: Path, sniff_bytes: int = ENCODING_SNIFF_BYTES) -> str:
+    """
+    只讀檔頭 sniff_bytes 位元組判斷編碼（依 ENCODING_CANDIDATES 順序嘗試）。
+    取樣尾端可能切在多位元組字元中間，因此用 incremental decoder（final=False）容忍。
+    全部失敗時回傳 "utf-8"，由 iter_input_lines 以 errors="ignore" 讀取。
+    """
+    with path.open("rb") as fb:
+        sample = fb.read(max(sniff_bytes, 4))
+    if sample.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    if sample.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return "utf-16"
+    for enc in ENCODING_CANDIDATES:
+        try:
+            codecs.getincrementaldecoder(enc)().decode(sample, final=False)
+            return enc
+        except Exception:
+            continue
+    return "utf-8"
+
+def iter_input_lines(path: Path) -> Iterator[str]:
+    """
+    逐行產生去頭尾空白後的非空行，不會把整個檔案讀進記憶體。
+    取樣之後若仍遇到無法解碼的位元組則略過（與舊版最後的 errors="ignore" 保底一致）。
+    """
+    enc = detect_encoding(path)
+    with path.open("r", encoding=enc, errors="ignore", newline=None) as fr:
+        for raw in fr:
+            ln = raw.strip()
+            if ln:
+                yield ln
+
+def _is_cut_point(line: str) -> bool:
+    return CHUNK_CUT_DIVISOR <= 1 or zlib.crc32(line.encode("utf-8")) % CHUNK_CUT_DIVISOR == 0
+
+def iter_chunks(lines: Iterable[str],
+                max_lines: int = CHUNK_MAX_LINES,
+                max_chars: int = CHUNK_MAX_CHARS,
+                min_lines: int = CHUNK_MIN_LINES) -> Iterator[List[str]]:
+    """
+    把行串流切成小批（行數與總字數皆有上限），每批送一次 LLM。
+    切點由行內容決定（見 CHUNK_CUT_DIVISOR），同樣的內容在不同檔案中會切出同樣的批次。
+    """
+    buf: List[str] = []
+    size = 0
+    for ln in lines:
+        if buf and (len(buf) >= max_lines or size + len(ln) > max_chars):
+            yield buf
+            buf, size = [], 0
+        buf.append(ln)
+        size += len(ln)
+        if len(buf) >= min_lines and _is_cut_point(ln):
+            yield buf
+            buf, size = [], 0
+    if buf:
+        yield buf
+
+# ===================== 本地預篩（低資訊行 / 對話視窗） =====================
+STOP_PHRASES = {
+    "哈", "哈哈", "哈哈哈", "呵呵", "嘿嘿", "嗯", "嗯嗯", "喔", "喔喔", "哦", "噢", "好", "好的", "好喔", "好哦",
+    "ok", "okay", "k", "kk", "對", "對啊", "是喔", "真的", "笑死", "xd", "lol", "謝謝", "感謝", "晚安", "早安",
+    "貼圖", "照片", "影片", "語音訊息", "檔案", "相簿", "記事本", "位置資訊", "聯絡資訊",
+    "sticker", "photo", "video", "voice message", "file",
+} | {re.sub(r"\s+", "", str(p).lower()) for p in PREFILTER_EXTRA_STOP}
+SYSTEM_MARKERS = (
+    "已收回訊息", "收回了訊息", "通話時間", "未接來電", "取消通話", "加入群組", "退出群組", "已邀請",
+    "更改了群組", "變更了群組", "已加入聊天", "已離開聊天", "unsent a message", "missed call",
+)
+# LINE 匯出格式：「10:23\t名字\t訊息」或「上午10:23 名字 訊息」
+RE_CHAT_MSG = re.compile(
+    r"^\s*(?:上午|下午|AM|PM)?\s*\d{1,2}:\d{2}\s*(?:\t(?P<who>[^\t]*)\t|\s+)(?P<msg>.*)$", re.I
+)
+RE_DATE_HEADER = re.compile(
+    r"^\s*(?P<date>\d{4}[./-]\d{1,2}[./-]\d{1,2})\s*(?:[（(][^）)]{1,6}[）)]|星期.|週.)?\s*$"
+)
+RE_PLACEHOLDER = re.compile(r"^\s*[\[［【][^\]］】]{1,12}[\]］】]\s*$")  # [貼圖]、[照片]…
+RE_EXPORT_HEADER = re.compile(r"^\s*(?:\[LINE\]|儲存日期|Chat history|Saved on)", re.I)
+RE_NON_WORD = re.compile(r"[\W_]+")
+
+def estimate_tokens(s: str) -> int:
+    """粗估 token 數：CJK 約一字一 token，其餘約四字元一 token。"""
+    cjk = sum(1 for ch in s if "\u3400" <= ch <= "\u9fff" or "\uf900" <= ch <= "\ufaff")
+    return cjk + (len(s) - cjk + 3) // 4
+
+def is_low_info(text: str) -> bool:
+    """判斷一段內容（已去掉時間/說話者）是否不值得送 LLM。"""
+    t = (text or "").strip()
+    if not t or RE_PLACEHOLDER.match(t):
+        return True
+    key = normalize_key(t).strip("。！？!?.~～,，")
+    if key in STOP_PHRASES:
+        return True
+    if any(m in t for m in SYSTEM_MARKERS):
+        return True
+    if extract_dates(t):
+        return False
+    core = RE_NON_WORD.sub("", t)  # 去掉表情符號/標點後剩下的字
+    if len(core) < PREFILTER_MIN_CHARS:
+        return True
+    # 「哈哈哈哈」「XDDD」「好好好」這類重複字（至少三字才算重複；「愛你」「媽媽」要留著）
+    return 3 <= len(core) <= 12 and len(set(core.lower())) <= 2
+
+def prefilter_lines(lines: Iterable[str],
+                    stats: Optional[dict] = None,
+                    enabled: Optional[bool] = None) -> Iterator[str]:
+    """
+    串流預篩：丟掉低資訊行；聊天訊息（有時間戳）依日期與大小合併成對話視窗，
+    一般段落（無時間戳）維持一行一段。stats 累加 lines / dropped / tokens_in / tokens_out。
+    """
+    if enabled is None:
+        enabled = PREFILTER_ENABLED
+
+    def _bump(key, n=1):
+        if stats is not None:
+            stats[key] = stats.get(key, 0) + n
+
+    def _emit(seg):
+        _bump("tokens_out", estimate_tokens(seg))
+        return seg
+
+    window: List[str] = []
+    win_chars = 0
+    cur_date = ""
+
+    def _flush():
+        nonlocal win_chars
+        if not window:
+            return None
+        seg = " / ".join(window)
+        if cur_date and not extract_dates(seg):
+            seg = f"{cur_date} {seg}"
+        window.clear()
+        win_chars = 0
+        return seg
+
+    for ln in lines:
+        _bump("lines")
+        _bump("tokens_in", estimate_tokens(ln))
+        if not enabled:
+            yield _emit(ln)
+            continue
+
+        if RE_DATE_HEADER.match(ln):
+            seg = _flush()
+            if seg:
+                yield _emit(seg)
+            cur_date = RE_DATE_HEADER.match(ln).group("date").replace(".", "/")
+            _bump("dropped")
+            continue
+        if RE_EXPORT_HEADER.match(ln):
+            _bump("dropped")
+            continue
+
+        m = RE_CHAT_MSG.match(ln)
+        if m is None:
+            # 一般段落：先送出累積中的視窗，再單獨送出本行
+            seg = _flush()
+            if seg:
+                yield _emit(seg)
+            if is_low_info(ln):
+                _bump("dropped")
+                continue
+            yield _emit(ln)
+            continue
+
+        msg = (m.group("msg") or "").strip()
+        if is_low_info(msg):
+            _bump("dropped")
+            continue
+        who = (m.group("who") or "").strip()
+        part = f"{who}：{msg}" if who else msg
+        if window and (len(window) >= WINDOW_MAX_MSGS or win_chars + len(part) > WINDOW_MAX_CHARS):
+            yield _emit(_flush())
+        window.append(part)
+        win_chars += len(part)
+
+    seg = _flush()
+    if seg:
+        yield _emit(seg)
+
 # ===================== 工具 =====================
 def role_from_filename(path: Path) -> str:
     """
@@ -87,10 +324,10 @@ def deduplicate_items(items: List[MemoryItem]) -> List[MemoryItem]:
         out.append(it)
     return out
 
-def filter_out_existing(path: Path, items: List[MemoryItem]) -> List[MemoryItem]:
-    if not (AVOID_DUP_IN_FILE and path.exists()):
-        return items
+def load_existing_keys(path: Path) -> Set[str]:
     existed = set()
+    if not path.exists():
+        return existed
     try:
         with path.open("r", encoding="utf-8") as fr:
             for line in fr:
@@ -99,6 +336,12 @@ def filter_out_existing(path: Path, items: List[MemoryItem]) -> List[MemoryItem]
                     existed.add(normalize_key(parts[1]))  # 以 detail 去重
     except Exception:
         pass
+    return existed
+
+def filter_out_existing(path: Path, items: List[MemoryItem]) -> List[MemoryItem]:
+    if not (AVOID_DUP_IN_FILE and path.exists()):
+        return items
+    existed = load_existing_keys(path)
     return [it for it in items if normalize_key(it.detail) not in existed]
 
 # ===================== LLM 濃縮（逐段，保留日期） =====================
@@ -118,159 +361,416 @@ def _safe_json_block(s: str) -> str:
     m = re.search(r"\[[\s\S]*\]|\{[\s\S]*\}", s)
     return m.group(0) if m else "[]"
 
+def _local_summarize_lines(lines: List[str]) -> List[MemoryItem]:
+    # 本地保底：去掉行首 HH:MM；summary 取前 40 字
+    items = []
+    for raw in lines:
+        txt = raw.strip()
+        if not txt:
+            continue
+        txt = RE_TIME_HM.sub("", txt)
+        summ = txt[:40] + ("…" if len(txt) > 40 else "")
+        items.append(MemoryItem(summary=summ, detail=txt))
+    return deduplicate_items(items)
+
+def _openai_summarize_lines(lines: List[str]) -> List[MemoryItem]:
+    """呼叫 OpenAI 濃縮；失敗時直接拋出例外，由呼叫端決定保底方式。"""
+    payload = "\n".join(lines)
+    messages = [
+        {"role": "system", "content": PROMPT_SYS},
+        {"role": "user",   "content": f"請整理下列多段共同回憶（每行一段）：\n{payload}"}
+    ]
+    RATE_LIMITER.wait()
+    # openai 模組層級的預設 client 是執行緒安全的，批次模式下所有檔案共用同一個連線池
+    resp = openai.chat.completions.create(
+        model=MODEL_NAME,
+        messages=messages,
+        temperature=0.2,
+    )
+    content = _safe_json_block(resp.choices[0].message.content)
+    data = json.loads(content)
+    items: List[MemoryItem] = []
+    for obj in data:
+        summ = (obj.get("summary") or "").strip()
+        det  = (obj.get("detail") or "").strip()
+        if not summ or not det:
+            continue
+        # 若 detail 無日期，但原輸入整體有日期 → 補救（取最常見的第一個）
+        if not (RE_DATE_YMD.search(det) or RE_DATE_MD.search(det) or RE_DATE_CJK.search(det)):
+            all_dates = []
+            for ln in lines:
+                all_dates += extract_dates(ln)
+            if all_dates:
+                det  = f"{all_dates[0]} {det}"
+                summ = f"{all_dates[0]} " + summ
+        items.append(MemoryItem(
+            summary=summ[:40] + ("…" if len(summ) > 40 else ""),
+            detail=det
+        ))
+    return deduplicate_items(items)
+
 def llm_summarize_lines(lines: List[str]) -> List[MemoryItem]:
     if not USE_OPENAI:
-        # 本地保底：去掉行首 HH:MM；summary 取前 40 字
-        items = []
-        for raw in lines:
-            txt = raw.strip()
-            if not txt:
-                continue
-            txt = RE_TIME_HM.sub("", txt)
-            summ = txt[:40] + ("…" if len(txt) > 40 else "")
-            items.append(MemoryItem(summary=summ, detail=txt))
-        return deduplicate_items(items)
-
+        return _local_summarize_lines(lines)
     try:
-        payload = "\n".join(lines)
-        messages = [
-            {"role": "system", "content": PROMPT_SYS},
-            {"role": "user",   "content": f"請整理下列多段共同回憶（每行一段）：\n{payload}"}
-        ]
-        resp = openai.chat.completions.create(
-            model=MODEL_NAME,
-            messages=messages,
-            temperature=0.2,
-        )
-        content = _safe_json_block(resp.choices[0].message.content)
-        data = json.loads(content)
-        items: List[MemoryItem] = []
-        for obj in data:
-            summ = (obj.get("summary") or "").strip()
-            det  = (obj.get("detail") or "").strip()
-            if not summ or not det:
-                continue
-            # 若 detail 無日期，但原輸入整體有日期 → 補救（取最常見的第一個）
-            if not (RE_DATE_YMD.search(det) or RE_DATE_MD.search(det) or RE_DATE_CJK.search(det)):
-                all_dates = []
-                for ln in lines:
-                    all_dates += extract_dates(ln)
-                if all_dates:
-                    det  = f"{all_dates[0]} {det}"
-                    summ = f"{all_dates[0]} " + summ
-            items.append(MemoryItem(
-                summary=summ[:40] + ("…" if len(summ) > 40 else ""),
-                detail=det
-            ))
-        return deduplicate_items(items)
+        return _openai_summarize_lines(lines)
     except Exception as e:
         print("[WARN] OpenAI 濃縮失敗，改用本地保底：", e)
-        # fallback
-        items = []
-        for raw in lines:
-            txt = raw.strip()
-            if not txt:
-                continue
-            txt = RE_TIME_HM.sub("", txt)
-            summ = txt[:40] + ("…" if len(txt) > 40 else "")
-            items.append(MemoryItem(summary=summ, detail=txt))
-        return deduplicate_items(items)
+        return _local_summarize_lines(lines)
 
-# ===================== 寫檔 =====================
-def append_shared_memories(role: str, memories: List[MemoryItem]) -> Tuple[Path, int]:
-    out_path = get_output_path(role)
+# ===================== 濃縮快取（內容定址） =====================
+# 提示詞一改，版本就跟著變，舊快取自然失效
+PROMPT_VERSION = hashlib.sha256(PROMPT_SYS.encode("utf-8")).hexdigest()[:12]
+
+def _normalize_chunk_text(lines: List[str]) -> str:
+    return "\n".join(re.sub(r"\s+", " ", ln).strip() for ln in lines if ln.strip())
 
-    # 過濾已存在的重複
-    memories = filter_out_existing(out_path, memories)
+def condense_cache_key(lines: List[str], model: Optional[str] = None) -> str:
+    h = hashlib.sha256()
+    for part in (model or MODEL_NAME, PROMPT_VERSION, _normalize_chunk_text(lines)):
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+def _cache_path(key: str) -> Path:
+    return CACHE_DIR / key[:2] / f"{key}.json"
+
+def cache_get(key: str) -> Optional[List[MemoryItem]]:
+    path = _cache_path(key)
+    try:
+        with path.open("r", encoding="utf-8") as fr:
+            data = json.load(fr)
+        return [MemoryItem(summary=o["summary"], detail=o["detail"]) for o in data["items"]]
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"[WARN] 快取檔損毀，忽略：{path}（{e}）")
+        return None
 
-    # 確保檔尾換行
-    needs_nl = False
-    if out_path.exists():
+def cache_put(key: str, items: List[MemoryItem]) -> None:
+    path = _cache_path(key)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with tmp.open("w", encoding="utf-8") as fw:
+            json.dump({
+                "model": MODEL_NAME,
+                "prompt_version": PROMPT_VERSION,
+                "items": [{"summary": it.summary, "detail": it.detail} for it in items],
+            }, fw, ensure_ascii=False)
+        os.replace(tmp, path)
+    except Exception as e:
+        print(f"[WARN] 寫入快取失敗：{e}")
         try:
-            with out_path.open("rb") as frb:
-                frb.seek(max(frb.seek(0, os.SEEK_END) or 0 - 1, 0))
-                last = frb.read() or b""
-                needs_nl = (not last.endswith(b"\n"))
+            tmp.unlink()
         except Exception:
-            needs_nl = False
+            pass
 
-    cnt = 0
-    with out_path.open("a", encoding="utf-8") as fw:
-        if needs_nl:
-            fw.write("\n")
+def condense_chunk(lines: List[str], stats: Optional[dict] = None) -> List[MemoryItem]:
+    """
+    濃縮一批行：先查快取，未命中才呼叫 OpenAI 並寫回快取。
+    本地保底的結果不寫入快取（下次有 API 時仍會重新濃縮）。
+    """
+    if not USE_OPENAI:
+        return _local_summarize_lines(lines)
+    key = condense_cache_key(lines) if CACHE_ENABLED else None
+    if key:
+        hit = cache_get(key)
+        if hit is not None:
+            if stats is not None:
+                stats["cache_hits"] = stats.get("cache_hits", 0) + 1
+            return hit
+        if stats is not None:
+            stats["cache_misses"] = stats.get("cache_misses", 0) + 1
+    try:
+        items = _openai_summarize_lines(lines)
+    except Exception as e:
+        print("[WARN] OpenAI 濃縮失敗，改用本地保底：", e)
+        return _local_summarize_lines(lines)
+    if key:
+        cache_put(key, items)
+    return items
+
+# ===================== 寫檔 =====================
+def _ends_with_newline(path: Path) -> bool:
+    try:
+        with path.open("rb") as frb:
+            end = frb.seek(0, os.SEEK_END)
+            if end == 0:
+                return True
+            frb.seek(end - 1)
+            return frb.read(1) == b"\n"
+    except Exception:
+        return True
+
+class SharedMemoryWriter:
+    """
+    逐批追加寫入 shared_memories_{角色名}.txt：
+    - 開檔前先載入既有 detail 的去重鍵（AVOID_DUP_IN_FILE），之後批次之間也互相去重
+    - 第一次真的有內容要寫時才建立暫存檔（先複製既有內容），沒有新內容就不動原檔
+    - 正常結束才以 os.replace 原子性替換；中途出錯則丟棄暫存檔，原檔保持不變
+    """
+    def __init__(self, out_path: Path):
+        self.path = out_path
+        self.count = 0
+        self._seen = load_existing_keys(out_path) if AVOID_DUP_IN_FILE else set()
+        self._tmp = out_path.with_name(f"{out_path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        self._fw = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+    def _open(self):
+        self._fw = self._tmp.open("w", encoding="utf-8", newline="")
+        if self.path.exists():
+            with self.path.open("r", encoding="utf-8", newline="") as fr:
+                shutil.copyfileobj(fr, self._fw)
+            if not _ends_with_newline(self.path):
+                self._fw.write("\n")
+
+    def add(self, memories: Iterable[MemoryItem]) -> List[MemoryItem]:
+        """寫入尚未出現過的項目，回傳實際寫入者。"""
+        written = []
         for m in memories:
             summary = m.summary.replace("\t", " ").strip()
             detail  = m.detail.replace("\t", " ").strip()
             if not summary or not detail:
                 continue
-            fw.write(f"{summary}\t{detail}\n")
-            cnt += 1
-    return out_path, cnt
+            key = normalize_key(detail)
+            if key in self._seen:
+                continue
+            self._seen.add(key)
+            if self._fw is None:
+                self._open()
+            self._fw.write(f"{summary}\t{detail}\n")
+            written.append(MemoryItem(summary=summary, detail=detail))
+        self.count += len(written)
+        return written
+
+    def close(self):
+        if self._fw is not None:
+            self._fw.flush()
+            os.fsync(self._fw.fileno())
+            self._fw.close()
+            self._fw = None
+            os.replace(self._tmp, self.path)
+
+    def discard(self):
+        if self._fw is not None:
+            self._fw.close()
+            self._fw = None
+            try:
+                self._tmp.unlink()
+            except Exception:
+                pass
+        self.count = 0
+
+def append_shared_memories(role: str, memories: List[MemoryItem]) -> Tuple[Path, int]:
+    with SharedMemoryWriter(get_output_path(role)) as writer:
+        writer.add(memories)
+    return writer.path, writer.count
+
+# ===================== 向量側檔（離線編碼） =====================
+_EMBEDDER = None
+_EMBED_LOCK = threading.Lock()
+
+def _get_embedder():
+    """延遲載入向量模型（整個行程只載一次，批次模式各執行緒共用）。"""
+    global _EMBEDDER
+    with _EMBED_LOCK:
+        if _EMBEDDER is None:
+            from shared_memory import SentenceTransformer, resolve_embedding_model
+            name = resolve_embedding_model(CONFIG)
+            print(f"[INFO] 載入向量模型：{name}")
+            _EMBEDDER = (name, SentenceTransformer(name))
+    return _EMBEDDER
+
+def update_vector_sidecar(out_path: Path) -> int:
+    """
+    依目前的 shared_memories_{角色名}.txt 補齊向量側檔，回傳新編碼筆數。
+    側檔格式、模型與正規化都沿用 shared_memory.py，SharedMemoryManager 載入時可直接使用。
+    """
+    from shared_memory import read_memory_file, sync_vector_sidecar, vector_sidecar_path
+    summaries, _ = read_memory_file(str(out_path))
+    name, model = _get_embedder()
+    with _EMBED_LOCK:
+        _, n_new = sync_vector_sidecar(model, name, summaries, vector_sidecar_path(str(out_path)))
+    return n_new
 
 # ===================== 核心流程 =====================
-def process_file(input_path: str) -> Tuple[str, int, List[MemoryItem]]:
+def process_file(input_path: str,
+                 keep_items: bool = True,
+                 stats: Optional[dict] = None) -> Tuple[str, int, List[MemoryItem]]:
     """
-    讀取 {角色名}.txt → 每行一段 → 濃縮 → 追加寫入 shared_memories/shared_memories_{角色名}.txt
+    串流讀取 {角色名}.txt → 每行一段 → 分批濃縮（先查快取） → 追加寫入 shared_memories/shared_memories_{角色名}.txt
     回傳：(輸出檔路徑, 寫入筆數, 寫入內容列表)
+    keep_items=False 時不保留寫入內容（回傳空列表），供超大檔案使用
+    stats 若給 dict，會累加 lines / dropped / tokens_in / tokens_out / chunks / cache_hits / cache_misses / embedded
     """
     path = Path(input_path)
     if not path.exists():
         raise FileNotFoundError(f"找不到輸入檔：{path}")
 
     role = role_from_filename(path)
-
-    # 讀行（多編碼嘗試）
-    raw = path.read_bytes()
-    text = None
-    for enc in ("utf-8", "utf-8-sig", "cp950", "big5", "utf-16"):
+    kept: List[MemoryItem] = []
+
+    with SharedMemoryWriter(get_output_path(role)) as writer:
+        for chunk in iter_chunks(prefilter_lines(iter_input_lines(path), stats)):
+            # 快取 / LLM 濃縮 / 本地保底
+            if stats is not None:
+                stats["chunks"] = stats.get("chunks", 0) + 1
+            items = condense_chunk(chunk, stats)
+            written = writer.add(items)
+            if keep_items:
+                kept.extend(written)
+
+    # 有新內容（或舊檔還沒有側檔）才編碼；失敗不影響文字檔，聊天端載入時會自行補齊
+    # （shared_memory 會載入 faiss / sentence_transformers，匯入本身也可能失敗，一併包在 try 內）
+    if EMBED_ON_WRITE and writer.path.exists():
         try:
-            text = raw.decode(enc)
-            break
-        except Exception:
-            continue
-    if text is None:
-        text = raw.decode("utf-8", errors="ignore")
-
-    # 依換行分段
-    lines = [ln.strip() for ln in text.splitlines() if ln.strip()]
-    if not lines:
-        return str(get_output_path(role)), 0, []
-
-    # LLM 濃縮 / 本地保底
-    items = llm_summarize_lines(lines)
-    if not items:
-        return str(get_output_path(role)), 0, []
-
-    # 寫入
-    out_path, n = append_shared_memories(role, items)
-    return str(out_path), n, items
+            from shared_memory import vector_sidecar_path
+            if writer.count or not os.path.exists(vector_sidecar_path(str(writer.path))):
+                n_new = update_vector_sidecar(writer.path)
+                if stats is not None:
+                    stats["embedded"] = stats.get("embedded", 0) + n_new
+        except Exception as e:
+            print(f"[WARN] 向量側檔更新失敗（{writer.path.name}）：{e}")
+
+    return str(writer.path), writer.count, kept
+
+def _process_group(paths: List[Path]) -> List[dict]:
+    """依序處理輸出到同一個角色檔的輸入檔（避免兩個執行緒同時替換同一個輸出檔）。"""
+    results = []
+    for p in paths:
+        stats = {"file": p.name, "output": str(get_output_path(role_from_filename(p))),
+                 "written": 0, "error": None}
+        t0 = time.perf_counter()
+        try:
+            out_path, n, _ = process_file(str(p), keep_items=False, stats=stats)
+            stats["output"], stats["written"] = out_path, n
+        except Exception as e:
+            stats["error"] = repr(e)
+        stats["seconds"] = time.perf_counter() - t0
+        results.append(stats)
+    return results
+
+def process_dir(input_dir: str, workers: int = BATCH_WORKERS) -> List[dict]:
+    """
+    批次處理資料夾內所有 *.txt（一個檔 = 一個角色），回傳每個檔案的統計：
+    file / output / lines / dropped / tokens_in / tokens_out / chunks / written / cache_hits / cache_misses /
+    embedded / seconds / error
+    """
+    root = Path(input_dir)
+    if not root.is_dir():
+        raise FileNotFoundError(f"找不到輸入資料夾：{root}")
+
+    groups = {}
+    for p in sorted(root.glob("*.txt")):
+        if p.is_file():
+            groups.setdefault(get_output_path(role_from_filename(p)), []).append(p)
+    if not groups:
+        return []
+
+    results: List[dict] = []
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(groups)))) as ex:
+        for res in ex.map(_process_group, groups.values()):
+            results.extend(res)
+    return results
+
+def token_reduction(stats: dict) -> float:
+    """預篩省下的估計 token 比例（0~1）。"""
+    t_in = stats.get("tokens_in", 0)
+    return 1.0 - stats.get("tokens_out", 0) / t_in if t_in else 0.0
+
+def print_batch_summary(results: List[dict], elapsed: float):
+    print(f"{'檔案':<24}{'行數':>8}{'濾除':>6}{'省token':>8}{'批次':>6}{'命中':>6}{'寫入':>6}{'向量':>6}{'秒':>8}{'行/秒':>9}")
+    total_lines = total_written = total_in = total_out = 0
+    for r in results:
+        lines = r.get("lines", 0)
+        secs = r.get("seconds", 0.0)
+        total_lines += lines
+        total_written += r.get("written", 0)
+        total_in += r.get("tokens_in", 0)
+        total_out += r.get("tokens_out", 0)
+        rate = lines / secs if secs > 0 else 0.0
+        print(f"{r['file']:<24}{lines:>8}{r.get('dropped', 0):>6}{token_reduction(r):>8.0%}{r.get('chunks', 0):>6}{r.get('cache_hits', 0):>6}"
+              f"{r.get('written', 0):>6}{r.get('embedded', 0):>6}{secs:>8.2f}{rate:>9.1f}")
+        if r.get("error"):
+            print(f"  [ERR] {r['error']}")
+    rate = total_lines / elapsed if elapsed > 0 else 0.0
+    saved = token_reduction({"tokens_in": total_in, "tokens_out": total_out})
+    print(f"[OK] {len(results)} 個檔案，共 {total_lines} 行、寫入 {total_written} 筆，預篩省下約 {saved:.0%} token，"
+          f"耗時 {elapsed:.2f} 秒（{rate:.1f} 行/秒）")
 
 # ===================== CLI =====================
 def main():
     # 先宣告 global，避免 "used prior to global declaration"
-    global MODEL_NAME
+    global MODEL_NAME, CACHE_ENABLED, RATE_LIMITER, EMBED_ON_WRITE, PREFILTER_ENABLED
 
     import argparse
     parser = argparse.ArgumentParser(description="共同回憶整理（CLI 版）")
 
-    # 改成旗標式輸入，符合你的呼叫方式
-    parser.add_argument("--input", "-i", required=True,
-                        help="{角色名}.txt 檔案路徑（每行一段共同回憶）")
+    # 改成旗標式輸入，符合你的呼叫方式；--input 與 --input-dir 擇一
+    src = parser.add_mutually_exclusive_group(required=True)
+    src.add_argument("--input", "-i",
+                     help="{角色名}.txt 檔案路徑（每行一段共同回憶）")
+    src.add_argument("--input-dir", "-d",
+                     help="批次模式：資料夾內每個 {角色名}.txt 各自整理")
 
     # default 改成 None，避免在宣告 global 前引用 MODEL_NAME
     parser.add_argument("--model", default=None,
                         help="OpenAI 模型名稱（若不指定則使用 config.json 的 model_name）")
 
+    parser.add_argument("--no-cache", action="store_true",
+                        help="不使用濃縮快取（每批都重新呼叫 OpenAI）")
+
+    parser.add_argument("--no-prefilter", action="store_true",
+                        help="不做本地預篩，每一行都送 LLM")
+    parser.add_argument("--no-embed", action="store_true",
+                        help="不產生向量側檔（改由聊天端 /use 時編碼）")
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS,
+                        help="批次模式平行處理的檔案數（預設讀 config.json 的 batch_workers）")
+    parser.add_argument("--max-rps", type=float, default=None,
+                        help="OpenAI 每秒請求上限，所有檔案共用（0 = 不限制）")
+
     args = parser.parse_args()
 
     # 若有指定 --model，才覆寫全域 MODEL_NAME
     if args.model:
         MODEL_NAME = args.model
-
-    print(f"[INFO] OpenAI={'ON' if USE_OPENAI else 'OFF'} | Model={MODEL_NAME}")
-    out_path, n, items = process_file(args.input)
+    if args.no_cache:
+        CACHE_ENABLED = False
+    if args.no_prefilter:
+        PREFILTER_ENABLED = False
+    if args.no_embed:
+        EMBED_ON_WRITE = False
+    if args.max_rps is not None:
+        RATE_LIMITER = RateLimiter(args.max_rps)
+
+    print(f"[INFO] OpenAI={'ON' if USE_OPENAI else 'OFF'} | Model={MODEL_NAME} | Cache={'ON' if CACHE_ENABLED else 'OFF'}")
+
+    if args.input_dir:
+        t0 = time.perf_counter()
+        results = process_dir(args.input_dir, workers=args.workers)
+        print_batch_summary(results, time.perf_counter() - t0)
+        if any(r.get("error") for r in results):
+            raise SystemExit(1)
+        return
+
+    stats = {}
+    out_path, n, items = process_file(args.input, stats=stats)
 
     print(f"[OK] 已寫入：{out_path}，共 {n} 筆")
+    print(f"[INFO] 讀入 {stats.get('lines', 0)} 行，預篩濾除 {stats.get('dropped', 0)} 行，"
+          f"估計 token {stats.get('tokens_in', 0)} → {stats.get('tokens_out', 0)}（省 {token_reduction(stats):.0%}）")
+    print(f"[INFO] 批次 {stats.get('chunks', 0)}，快取命中 {stats.get('cache_hits', 0)} / 未命中 {stats.get('cache_misses', 0)}，"
+          f"新編碼向量 {stats.get('embedded', 0)} 筆")
     for it in items:
         print(f"- {it.summary}\t{it.detail}")
 
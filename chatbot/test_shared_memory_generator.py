@@ -0,0 +1,16 @@
+# filename: test_shared_memory_generator.py
+# 本地預篩規則（不需 numpy / OpenAI）：  python -m pytest -q test_shared_memory_generator.py
+
+import pytest
+
+from shared_memory_generator import is_low_info
+
+
+@pytest.mark.parametrize("text", ["愛你", "想你", "生日", "晚餐", "媽媽", "明天見", "我到家了"])
+def test_short_meaningful_lines_are_kept(text):
+    assert not is_low_info(text)
+
+
+@pytest.mark.parametrize("text", ["哈哈哈", "哈哈哈哈哈", "XDDD", "xddd!!", "好好好", "嗯嗯嗯嗯", "[貼圖]", "好", "OK"])
+def test_laughter_and_filler_are_dropped(text):
+    assert is_low_info(text)
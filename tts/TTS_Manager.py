@@ -1,22 +1,34 @@
 # filename: TTS_Manager.py
 # F5-TTS manager: compatible signatures + ref-audio tail clean + optional pad + output fadeout
+# Reference audio/text/mel conditioning are prepared once in prepare_reference and reused per request.
+# Finished segments are kept in a disk LRU (tts_cache.SegmentCache) and reused across requests.
 
-import os, re
-from typing import Optional, List
+import os, re, time, hashlib, threading
+from functools import lru_cache
+from typing import Optional, List, Iterator
+from collections import OrderedDict
 from pathlib import Path
 from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 import torch
+import torchaudio
 import soundfile as sf
-from pydub import AudioSegment
-from pydub.silence import detect_nonsilent
+import soxr
 from cached_path import cached_path
 
 from f5_tts.infer.utils_infer import (
-    preprocess_ref_audio_text, load_model, load_vocoder, infer_process,
+    transcribe, load_model, load_vocoder, chunk_text,
+    target_sample_rate, hop_length, target_rms, cfg_strength, sway_sampling_coef,
 )
 from f5_tts.model import DiT
+from f5_tts.model.utils import convert_char_to_pinyin
+
+from tts_cache import SegmentCache
+from tts_swaps import SwapTable, load_swaps
+from tts_refaudio import voice_span, edge_span, REF_EDGE_PAD_MS
+import tts_metrics as metrics
 
 torch.set_float32_matmul_precision("high")
 if torch.cuda.is_available():
@@ -24,12 +36,20 @@ if torch.cuda.is_available():
 
 # ====== Parameters (env overridable) ======
 SWAPS_PATH  = Path(os.getenv("F5TTS_SWAPS", str(Path(__file__).parent / "swaps.txt")))
+SWAPS_CHECK_SEC = float(os.getenv("F5TTS_SWAPS_CHECK_SEC", "2"))   # swaps.txt mtime poll (0 = no reload)
+TEXT_CACHE_SIZE = int(os.getenv("F5TTS_TEXT_CACHE", "1024"))      # processed-text LRU entries
 MODEL_NAME  = os.getenv("F5TTS_MODEL", "F5TTS_v1_Base")
 CKPT_FILE   = os.getenv("F5TTS_CKPT",  "hf://SWivid/F5-TTS/F5TTS_v1_Base/model_1250000.safetensors")
 VOCAB_FILE  = os.getenv("F5TTS_VOCAB", "hf://SWivid/F5-TTS/F5TTS_v1_Base/vocab.txt")
 
 DEFAULT_SPEED   = float(os.getenv("F5TTS_DEFAULT_SPEED", "0.90"))
 DEFAULT_NFE     = int(os.getenv("F5TTS_NFE", "16"))
+# Quality tiers (flow-matching steps); requests pick one by name, see tts_scheduler for "adaptive"
+NFE_TIERS = {
+    "fast":     int(os.getenv("F5TTS_NFE_FAST", "8")),
+    "balanced": int(os.getenv("F5TTS_NFE_BALANCED", str(DEFAULT_NFE))),
+    "hq":       int(os.getenv("F5TTS_NFE_HQ", "32")),
+}
 DEFAULT_XFADE   = float(os.getenv("F5TTS_XFADE", "0.12"))
 DEFAULT_PAUSEMS = int(os.getenv("F5TTS_PAUSE_MS", "400"))
 REMOVE_SIL_DEF  = os.getenv("F5TTS_REMOVE_SIL", "false").lower() == "true"
@@ -37,14 +57,45 @@ REMOVE_SIL_DEF  = os.getenv("F5TTS_REMOVE_SIL", "false").lower() == "true"
 CHUNK_MIN = int(os.getenv("F5TTS_CHUNK_MIN", "22"))
 CHUNK_MAX = int(os.getenv("F5TTS_CHUNK_MAX", "160"))
 
-SIL_MIN_MS     = int(os.getenv("F5TTS_SIL_MIN_MS", "120"))
-SIL_THRESH_REL = float(os.getenv("F5TTS_SIL_THRESH_DB", "-30"))
-SIL_BACKOFF_MS = int(os.getenv("F5TTS_SIL_BACKOFF_MS", "20"))
+# Batched inference: max segments per forward pass, and max length ratio inside one batch
+BATCH_MAX       = int(os.getenv("F5TTS_BATCH_MAX", "8" if torch.cuda.is_available() else "4"))
+BATCH_LEN_RATIO = float(os.getenv("F5TTS_BATCH_LEN_RATIO", "1.5"))
+MAX_DURATION    = 4096  # CFM.sample default max_duration (mel frames)
+
+# CPU inference (ignored on CUDA, which always runs fp16):
+#   fp32 | int8 (dynamic int8 quantisation of the DiT's nn.Linear) | bf16 (autocast, needs AVX512-BF16/AMX)
+CPU_PRECISION       = os.getenv("F5TTS_CPU_PRECISION", "fp32").lower()
+CPU_THREADS         = int(os.getenv("F5TTS_CPU_THREADS", "0"))           # intra-op; 0 = torch default
+CPU_INTEROP_THREADS = int(os.getenv("F5TTS_CPU_INTEROP_THREADS", "0"))
+
+# Reference prep after the silence trim (tts_refaudio): voice-length cap, silent tail, fades
 REF_FADEIN_MS  = int(os.getenv("F5TTS_REF_FADEIN_MS", "8"))
 REF_FADEOUT_MS = int(os.getenv("F5TTS_REF_FADEOUT_MS", "12"))
 REF_MAX_VOICE_MS = int(os.getenv("F5TTS_REF_MAX_VOICE_MS", "10000"))  # limit voice part to 10s
 REF_TAIL_SIL_MS  = int(os.getenv("F5TTS_REF_TAIL_SIL_MS", "2000"))    # add 2s silence tail
 
+# Inference backend: eager | compile (torch.compile of the DiT and vocoder decode; inductor artefacts
+# are cached under COMPILE_CACHE so a restart/warmup reuses them instead of re-tracing)
+BACKEND       = os.getenv("F5TTS_BACKEND", "eager").lower()
+COMPILE_MODE  = os.getenv("F5TTS_COMPILE_MODE", "default")   # default | reduce-overhead | max-autotune
+COMPILE_CACHE = Path(os.getenv("F5TTS_COMPILE_CACHE", str(Path(__file__).parent / "_compile_cache")))
+
+if not torch.cuda.is_available():
+    if CPU_THREADS > 0:
+        torch.set_num_threads(CPU_THREADS)
+    if CPU_INTEROP_THREADS > 0:
+        try:
+            torch.set_num_interop_threads(CPU_INTEROP_THREADS)
+        except RuntimeError as e:  # only allowed before the first parallel op
+            print(f"[WARN] interop threads not set: {e}")
+
+# Voice registry: voices/<id>.wav etc. are prepared on first use; at most MAX_VOICES kept (LRU)
+VOICES_DIR  = Path(os.getenv("F5TTS_VOICES_DIR", str(Path(__file__).parent / "voices")))
+MAX_VOICES  = int(os.getenv("F5TTS_MAX_VOICES", "8"))
+MAX_REF_TEXT_VARIANTS = int(os.getenv("F5TTS_MAX_REF_TEXT_VARIANTS", "4"))   # per voice, LRU
+VOICE_EXTS  = (".wav", ".aac", ".mp3", ".m4a", ".flac", ".ogg")
+_VOICE_ID_RE = re.compile(r"[\w.-]+")
+
 TRIM_LEAD_MS   = int(os.getenv("F5TTS_TRIM_LEAD_MS", "80"))
 OUT_FADEIN_MS  = int(os.getenv("F5TTS_FADEIN_MS", "8"))
 OUT_FADEOUT_MS = int(os.getenv("F5TTS_FADEOUT_MS", "24"))
@@ -52,6 +103,14 @@ LEAD_REL_EPS   = float(os.getenv("F5TTS_LEAD_REL_EPS", "0.01"))
 
 _DIRECTIVE_KEYWORDS = "語速|速度|停頓|語氣|情緒|情感|節奏|台灣|臺灣|口語|自然|無兒化|tone|style|慢|快".split("|")
 _BRACKET_PAIRS = [("（","）"),("(",")"),("[","]")]
+_RE_DIRECTIVE_GROUPS = [re.compile(r"（([^）]{1,120})）"), re.compile(r"\(([^)]{1,120})\)"),
+                        re.compile(r"\[([^\]]{1,120})\]")]
+_RE_WS         = re.compile(r"\s+")
+_RE_SPACES     = re.compile(r"[\u00A0\u2000-\u200B\u3000]")
+_RE_TILDES     = re.compile(r"[~～]+")
+_RE_DASHES     = re.compile(r"[—–-]{2,}")
+_RE_END_PUNCT  = re.compile(r"[。！？!?]$")
+_RE_SENT_SPLIT = re.compile(r"(?<=[。！？!?])\s+")
 
 def _strip_directives(text: str) -> str:
     if not text: return text
@@ -67,62 +126,27 @@ def _strip_directives(text: str) -> str:
     def _rm(m):
         seg = m.group(1)
         return "" if any(k in seg for k in _DIRECTIVE_KEYWORDS) else m.group(0)
-    t = re.sub(r"（([^）]{1,120})）", _rm, t)
-    t = re.sub(r"\(([^)]{1,120})\)", _rm, t)
-    t = re.sub(r"\[([^\]]{1,120})\]", _rm, t)
-    return re.sub(r"\s+", " ", t).strip()
+    for rx in _RE_DIRECTIVE_GROUPS:
+        t = rx.sub(_rm, t)
+    return _RE_WS.sub(" ", t).strip()
 
 def _normalize_text(text: str) -> str:
     if not text: return ""
-    t = re.sub(r"[\u00A0\u2000-\u200B\u3000]", " ", text)
-    t = re.sub(r"[~～]+", "，", t)
-    t = re.sub(r"[—–-]{2,}", "—", t)
+    t = _RE_SPACES.sub(" ", text)
+    t = _RE_TILDES.sub("，", t)
+    t = _RE_DASHES.sub("—", t)
     lines = [ln.strip() for ln in t.replace("\r\n","\n").replace("\r","\n").split("\n")]
     fixed = []
     for ln in lines:
         if not ln: continue
-        if not re.search(r"[。！？!?]$", ln): ln += "。"
+        if not _RE_END_PUNCT.search(ln): ln += "。"
         fixed.append(ln)
     return "\n".join(fixed)
 
-class _SwapRule:
-    def __init__(self, pattern: str, replacement: str, is_regex: bool):
-        self.replacement = replacement
-        self.rx = re.compile(pattern) if is_regex else re.compile(re.escape(pattern))
-    def apply(self, s: str) -> str:
-        return self.rx.sub(self.replacement, s)
-
-def _load_swaps(path: Path):
-    rules = []
-    if not path.is_file():
-        return rules
-    with path.open("r", encoding="utf-8") as f:
-        for raw in f:
-            line = raw.strip()
-            if not line or line.startswith("#") or "=>" not in line:
-                continue
-            pat, rep = line.split("=>", 1)
-            pat = pat.strip()
-            rep = rep.split("#", 1)[0].strip()
-            is_regex = False
-            if pat.startswith("re:"):
-                pat = pat[3:].strip()
-                is_regex = True
-            if rep == "":
-                continue
-            rules.append(_SwapRule(pat, rep, is_regex))
-    return rules
-
-def _apply_swaps(text: str, rules) -> str:
-    out = text
-    for r in rules:
-        out = r.apply(out)
-    return out
-
 def _smart_segment(text: str, min_chars=CHUNK_MIN, max_chars=CHUNK_MAX) -> List[str]:
     raw = [ln.strip() for ln in text.split("\n") if ln.strip()]
     if not raw:
-        raw = [seg.strip() for seg in re.split(r"(?<=[。！？!?])\s+", text) if seg.strip()]
+        raw = [seg.strip() for seg in _RE_SENT_SPLIT.split(text) if seg.strip()]
     merged, buf = [], ""
     for seg in raw:
         if len(buf) + len(seg) <= max_chars:
@@ -139,72 +163,607 @@ def _smart_segment(text: str, min_chars=CHUNK_MIN, max_chars=CHUNK_MAX) -> List[
             out.append(seg)
     return out
 
+@lru_cache(maxsize=TEXT_CACHE_SIZE)
+def _frontend(text: str, strip_meta: bool, swaps: SwapTable) -> tuple:
+    """Directives -> normalise -> swaps -> segments; cached per swaps table (reload = new key)."""
+    t = (text or "").strip()
+    if strip_meta:
+        t = _strip_directives(t)
+    t = _normalize_text(t)
+    return tuple(_smart_segment(swaps.apply(t), CHUNK_MIN, CHUNK_MAX))
+
 def _resolve_path(p: Optional[str]) -> Optional[str]:
     if not p: return None
     return str(cached_path(p)) if p.startswith("hf://") else p
 
+def _file_md5(path: str) -> str:
+    h = hashlib.md5()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def _trim_lead(wave: np.ndarray, sr: int, peak: float) -> np.ndarray:
+    """Drop TRIM_LEAD_MS of low-energy head (relative to peak)."""
+    n = min(len(wave), int(sr * TRIM_LEAD_MS / 1000))
+    if TRIM_LEAD_MS > 0 and n > 8 and peak > 0 and np.max(np.abs(wave[: n // 2])) < LEAD_REL_EPS * peak:
+        return wave[n:]
+    return wave
+
+def _fade(wave: np.ndarray, sr: int, ms: int, *, head: bool):
+    """In-place linear fade-in (head=True) or fade-out of a float array."""
+    m = min(len(wave), int(sr * ms / 1000)) if ms > 0 else 0
+    if m > 1:
+        if head:
+            wave[:m] *= np.linspace(0.0, 1.0, m, dtype=wave.dtype)
+        else:
+            wave[-m:] *= np.linspace(1.0, 0.0, m, dtype=wave.dtype)
+
+def _load_mono(path: str, sr: int) -> np.ndarray:
+    """Decode to float32 mono at sr (soundfile; torchaudio/ffmpeg for aac, m4a, ...)."""
+    try:
+        x, file_sr = sf.read(path, dtype="float32", always_2d=True)
+    except (sf.LibsndfileError, RuntimeError):
+        t, file_sr = torchaudio.load(path)
+        x = t.numpy().T
+    x = x[:, 0] if x.shape[1] == 1 else x.mean(axis=1, dtype=np.float32)
+    if file_sr != sr:
+        x = soxr.resample(x, file_sr, sr)
+    return np.ascontiguousarray(x, dtype=np.float32)
+
+def _write_wav_atomic(output_path: str, wave: np.ndarray, sr: int):
+    """Write to a sibling temp file and rename, so readers never see a half-written wav."""
+    out = Path(output_path)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    tmp = out.with_name(f".{out.name}.{os.getpid()}.{threading.get_ident()}.part")
+    try:
+        sf.write(str(tmp), wave, sr, format="WAV")
+        os.replace(tmp, out)
+    except BaseException:
+        try:
+            tmp.unlink()
+        except OSError:
+            pass
+        raise
+
+def _cross_fade_join(waves: List[np.ndarray], cross_fade_sec: float) -> np.ndarray:
+    """Join chunk waves of one segment like f5_tts infer_batch_process (linear cross-fade).
+
+    Overlaps are known up front, so the result is written once into a float32 buffer.
+    """
+    if len(waves) == 1:
+        return np.asarray(waves[0], dtype=np.float32)
+    xf = int(cross_fade_sec * target_sample_rate)
+    overlaps, total = [], len(waves[0])
+    for nxt in waves[1:]:
+        n = max(0, min(xf, total, len(nxt)))
+        overlaps.append(n)
+        total += len(nxt) - n
+    out = np.empty(total, dtype=np.float32)
+    pos = len(waves[0])
+    out[:pos] = waves[0]
+    for nxt, n in zip(waves[1:], overlaps):
+        if n:
+            tail = out[pos - n:pos]
+            tail *= np.linspace(1, 0, n, dtype=np.float32)
+            tail += nxt[:n] * np.linspace(0, 1, n, dtype=np.float32)
+        out[pos:pos + len(nxt) - n] = nxt[n:]
+        pos += len(nxt) - n
+    return out
+
+def _join_with_pauses(waves: List[np.ndarray], gap: int, *, lead_gap: bool = False) -> np.ndarray:
+    """Write waves into one preallocated float32 buffer with `gap` zero samples between them
+    (and before the first one if lead_gap, as streamed chunks after the first need)."""
+    total = sum(len(w) for w in waves) + gap * (len(waves) - 1 + int(lead_gap))
+    out = np.empty(total, dtype=np.float32)
+    pos = 0
+    for i, w in enumerate(waves):
+        if gap and (i or lead_gap):
+            out[pos:pos + gap] = 0.0
+            pos += gap
+        out[pos:pos + len(w)] = w
+        pos += len(w)
+    return out
+
+class _RefVoice:
+    """A prepared reference: processed audio on device, its ref text and the mel conditioning.
+
+    Mirrors what f5_tts infer_process/infer_batch_process recompute on every call
+    (load wav, mono, RMS normalise, resample, mel), so synthesis can start at model.sample.
+    """
+    def __init__(self, voice_id: str, file_hash: str, ref_text: str,
+                 audio: torch.Tensor, rms: float, cond: torch.Tensor, base_text: str = ""):
+        self.voice_id = voice_id
+        self.file_hash = file_hash  # md5 of the source file the voice was prepared from
+        self.base_text = base_text  # ref_text given at prepare time ("" = ASR)
+        self.audio = audio          # (1, samples) at target_sample_rate, on device
+        self.rms = rms              # RMS of the reference before normalisation
+        self.cond = cond            # (1, frames, n_mels) mel conditioning
+        self.seconds = audio.shape[-1] / target_sample_rate
+        self.ref_len = audio.shape[-1] // hop_length
+        self.variants: "OrderedDict[str, _RefVoice]" = OrderedDict()   # ref_text overrides (LRU)
+        self.set_text(ref_text)
+
+    def set_text(self, ref_text: str):
+        # same punctuation rules as preprocess_ref_audio_text / infer_batch_process
+        if not ref_text.endswith(". ") and not ref_text.endswith("。"):
+            ref_text += " " if ref_text.endswith(".") else ". "
+        if len(ref_text[-1].encode("utf-8")) == 1:
+            ref_text = ref_text + " "
+        self.ref_text = ref_text
+        self.ref_text_bytes = len(ref_text.encode("utf-8"))
+
+    @property
+    def cache_tag(self) -> str:
+        """Identity of the conditioning for the segment cache (model + source audio + transcript)."""
+        return f"{MODEL_NAME}|{CKPT_FILE}|{self.file_hash}|{self.ref_text}"
+
+    def with_text(self, ref_text: str) -> "_RefVoice":
+        """Same audio/conditioning, different transcript (per-request ref_text override)."""
+        other = self.variants.pop(ref_text, None)   # pop + re-insert: LRU order without move_to_end races
+        if other is None:
+            other = _RefVoice.__new__(_RefVoice)
+            other.__dict__.update(self.__dict__)   # shares audio/cond tensors
+            other.variants = OrderedDict()
+            other.set_text(ref_text)
+        if MAX_REF_TEXT_VARIANTS > 0:
+            self.variants[ref_text] = other
+            while len(self.variants) > MAX_REF_TEXT_VARIANTS:
+                try:
+                    self.variants.popitem(last=False)
+                except KeyError:
+                    break
+        return other
+
+def _cpu_bf16_supported() -> bool:
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except Exception:
+        return False
+
+def _resolve_precision(device: str, requested: str) -> str:
+    if device == "cuda":
+        return "fp16"
+    if requested == "bf16" and not _cpu_bf16_supported():
+        print("[WARN] bf16 not supported on this CPU, using fp32")
+        return "fp32"
+    if requested not in ("fp32", "int8", "bf16"):
+        print(f"[WARN] unknown F5TTS_CPU_PRECISION={requested!r}, using fp32")
+        return "fp32"
+    return requested
+
+def check_voice_id(voice_id: str) -> str:
+    """Voice ids come from clients and name a file stem in VOICES_DIR, never a path (ValueError)."""
+    if not _VOICE_ID_RE.fullmatch(voice_id) or ".." in voice_id:
+        raise ValueError(f"invalid voice id: {voice_id!r}")
+    return voice_id
+
 class TTSManager:
-    """F5-TTS manager: keep old method signatures to avoid TypeError."""
-    def __init__(self):
+    """F5-TTS manager: keep old method signatures to avoid TypeError.
+
+    Holds a registry of prepared voices (LRU, at most MAX_VOICES); unknown voice ids are
+    looked up in VOICES_DIR and prepared on first use.
+    """
+    def __init__(self, *, cpu_precision: Optional[str] = None, backend: Optional[str] = None):
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        print(f"OK F5-TTS device: {self.device}{' - ' + torch.cuda.get_device_name(0) if self.device=='cuda' else ''}")
-        self.ref_wav_path = "temp_ref.wav"
-        self.prepared = False
-        self._swap_rules = _load_swaps(SWAPS_PATH)
+        self.precision = _resolve_precision(self.device, (cpu_precision or CPU_PRECISION).lower())
+        self.backend = (backend or BACKEND).lower()
+        print(f"OK F5-TTS device: {self.device}{' - ' + torch.cuda.get_device_name(0) if self.device=='cuda' else ''}"
+              f" | precision={self.precision} | backend={self.backend}"
+              f"{'' if self.device == 'cuda' else f' | threads={torch.get_num_threads()}'}")
+        self.ref_wav_path = "temp_ref.wav"  # last prepared reference (kept for compatibility)
+        self.active_voice: Optional[str] = None
+        self._voices: "OrderedDict[str, _RefVoice]" = OrderedDict()
+        self._voice_lock = threading.RLock()
+        self.batch_max = BATCH_MAX
+        self._infer_lock = threading.Lock()   # one model pass at a time (scheduler worker, streams, warmup)
+        self._swap_rules = load_swaps(SWAPS_PATH)
+        self._swaps_checked = time.monotonic()
+        self.cache = SegmentCache()
+        self._warm: set = set()   # _shape_key()s that have been through a model pass
         self._load_models()
 
+    def _apply_backend(self):
+        """Wrap the DiT and vocoder decode in torch.compile (dynamic shapes: text/mel lengths vary).
+
+        Compilation happens lazily on the first call (the warmup); the inductor FX graph cache
+        under COMPILE_CACHE makes later processes load kernels instead of recompiling them.
+        """
+        if self.backend == "eager":
+            return
+        if self.backend != "compile" or not hasattr(torch, "compile"):
+            print(f"[WARN] backend {self.backend!r} not available, using eager")
+            self.backend = "eager"
+            return
+        COMPILE_CACHE.mkdir(parents=True, exist_ok=True)
+        os.environ.setdefault("TORCHINDUCTOR_CACHE_DIR", str(COMPILE_CACHE))
+        try:
+            import torch._inductor.config as inductor_config
+            inductor_config.fx_graph_cache = True
+        except Exception as e:
+            print(f"[WARN] inductor graph cache not enabled: {e}")
+        self.ema_model.transformer = torch.compile(self.ema_model.transformer, mode=COMPILE_MODE, dynamic=True)
+        self.vocoder.decode = torch.compile(self.vocoder.decode, mode=COMPILE_MODE, dynamic=True)
+        print(f"OK torch.compile mode={COMPILE_MODE} cache={os.environ['TORCHINDUCTOR_CACHE_DIR']}")
+
+    @property
+    def prepared(self) -> bool:
+        return self.active_voice is not None
+
+    @property
+    def warm_shapes(self) -> int:
+        return len(self._warm)
+
+    def _shape_key(self, batch: int, frames: int) -> tuple:
+        """Warm-state key: model/device/precision/backend, batch size, padded mel length (pow2 bucket)."""
+        return (MODEL_NAME, self.device, self.precision, self.backend, batch,
+                1 << max(0, frames - 1).bit_length())
+
     def _load_models(self):
-        ckpt  = _resolve_path(CKPT_FILE)
-        vocab = _resolve_path(VOCAB_FILE)
-        self.vocoder = load_vocoder()
-        self.ema_model = load_model(
-            DiT,
-            dict(dim=1024, depth=22, heads=16, ff_mult=2, text_dim=512, conv_layers=4),
-            ckpt,
-            vocab_file=vocab,
-        )
+        # vocoder and DiT are independent downloads/deserialisations: load them side by side
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=2, thread_name_prefix="f5-load") as pool:
+            voc = pool.submit(load_vocoder)
+            ckpt  = _resolve_path(CKPT_FILE)
+            vocab = _resolve_path(VOCAB_FILE)
+            self.ema_model = load_model(
+                DiT,
+                dict(dim=1024, depth=22, heads=16, ff_mult=2, text_dim=512, conv_layers=4),
+                ckpt,
+                vocab_file=vocab,
+            )
+            self.vocoder = voc.result()
         if self.device == "cuda":
             self.ema_model.to(dtype=torch.float16)
-        print(f"OK Model loaded: {MODEL_NAME} | ckpt={ckpt}")
-        print(f"OK swaps: {SWAPS_PATH} ({len(self._swap_rules)} rules)")
-
-    def prepare_reference(self, wav_file: str, ref_text: str = ""):
-        """Prepare reference audio: trim head/tail, limit voice, add tail silence and fades."""
+        elif self.precision == "int8":
+            # weights int8, activations quantised per batch; mel_spec and vocoder stay fp32
+            self.ema_model = torch.ao.quantization.quantize_dynamic(
+                self.ema_model, {torch.nn.Linear}, dtype=torch.qint8)
+        self._apply_backend()
+        print(f"OK Model loaded: {MODEL_NAME} | ckpt={ckpt} ({time.perf_counter() - t0:.1f}s)")
+        print(f"OK swaps: {SWAPS_PATH} ({len(self._swap_rules)} rules, {len(self._swap_rules.stages)} passes)")
+
+    def prepare_reference(self, wav_file: str, ref_text: str = "", *,
+                          voice_id: Optional[str] = None, activate: bool = True) -> str:
+        """Prepare reference audio: trim head/tail, limit voice, add tail silence and fades.
+
+        The voice is registered under voice_id (default: file stem); re-preparing the same
+        file with the same ref_text is a cache hit and only switches the active voice.
+        """
         if not os.path.isfile(wav_file):
             raise FileNotFoundError(f"找不到參考音檔：{wav_file}")
-        audio = AudioSegment.from_file(wav_file).set_frame_rate(24000).set_channels(1)
-
-        # Detect non-silent spans to trim head & tail
-        thresh = audio.dBFS + SIL_THRESH_REL
-        nonsil = detect_nonsilent(audio, min_silence_len=SIL_MIN_MS, silence_thresh=thresh)
-        if nonsil:
-            start_ms = max(0, nonsil[0][0] - SIL_BACKOFF_MS)
-            end_ms   = min(len(audio), nonsil[-1][1] + SIL_BACKOFF_MS)
-            audio = audio[start_ms:end_ms]
-
-        # Limit the speech portion to REF_MAX_VOICE_MS, then append REF_TAIL_SIL_MS silence
+        voice_id = voice_id or Path(wav_file).stem
+        ref_text = ref_text or ""
+        src_hash = _file_md5(wav_file)
+
+        with self._voice_lock:
+            cur = self._voices.get(voice_id)
+            if cur is not None and cur.file_hash == src_hash and cur.base_text == ref_text:
+                self._voices.move_to_end(voice_id)
+                if activate:
+                    self.active_voice = voice_id
+                print(f"Ref cache hit: {voice_id} ({src_hash[:8]})")
+                return voice_id
+
+        t0 = time.perf_counter()
+        audio = self._trim_reference(wav_file)
+        if not ref_text.strip():
+            ref_text_ready = transcribe({"raw": audio.copy(), "sampling_rate": target_sample_rate})
+        else:
+            ref_text_ready = ref_text
+        voice = self._build_voice(voice_id, src_hash, audio, ref_text_ready)
+        voice.base_text = ref_text
+
+        with self._voice_lock:
+            self._voices[voice_id] = voice
+            self._voices.move_to_end(voice_id)
+            if activate or self.active_voice is None:
+                self.active_voice = voice_id
+            self._evict_voices()
+        self.ref_wav_path = wav_file
+        print(f"Ref ready (trimmed + tail pad): {voice_id} {voice.seconds:.2f}s "
+              f"({(time.perf_counter() - t0) * 1000:.0f} ms)")
+        return voice_id
+
+    def _trim_reference(self, wav_file: str) -> np.ndarray:
+        """Reference file -> float32 mono at target_sample_rate, ready for _build_voice."""
+        sr = target_sample_rate
+        audio = _load_mono(wav_file, sr)
+
+        # Trim head & tail silence, limit the speech portion to REF_MAX_VOICE_MS
+        start, end = voice_span(audio, sr)
         if REF_MAX_VOICE_MS > 0:
-            audio = audio[:REF_MAX_VOICE_MS]
-        if REF_TAIL_SIL_MS > 0:
-            audio += AudioSegment.silent(duration=REF_TAIL_SIL_MS)
+            end = min(end, start + sr * REF_MAX_VOICE_MS // 1000)
+
+        # Append REF_TAIL_SIL_MS silence, then fades
+        pad = sr * REF_TAIL_SIL_MS // 1000 if REF_TAIL_SIL_MS > 0 else 0
+        out = np.zeros(end - start + pad, dtype=np.float32)
+        out[:end - start] = audio[start:end]
+        _fade(out, sr, REF_FADEIN_MS, head=True)
+        _fade(out, sr, REF_FADEOUT_MS, head=False)
+
+        # Approximates what preprocess_ref_audio_text did to the exported file: edges below
+        # REF_EDGE_DB off, REF_EDGE_PAD_MS of silence on. Its collapse of inner pauses > 2 s is not
+        # reproduced, so a reference with long pauses conditions slightly differently than before.
+        start, end = edge_span(out, sr)
+        ref = np.zeros(end - start + sr * REF_EDGE_PAD_MS // 1000, dtype=np.float32)
+        ref[:end - start] = out[start:end]
+        return ref
+
+    def _evict_voices(self):
+        """Drop least-recently-used voices beyond MAX_VOICES (never the active one)."""
+        while len(self._voices) > max(1, MAX_VOICES):
+            victim = next((vid for vid in self._voices if vid != self.active_voice), None)
+            if victim is None:
+                break
+            del self._voices[victim]
+            print(f"Voice evicted (LRU): {victim}")
+
+    def _find_voice_file(self, voice_id: str) -> Optional[Path]:
+        check_voice_id(voice_id)
+        for ext in VOICE_EXTS:
+            p = VOICES_DIR / f"{voice_id}{ext}"
+            if p.is_file():
+                return p
+        return None
+
+    def list_voices(self) -> dict:
+        available = sorted({p.stem for p in VOICES_DIR.glob("*") if p.suffix.lower() in VOICE_EXTS}) \
+            if VOICES_DIR.is_dir() else []
+        with self._voice_lock:
+            return {"active": self.active_voice, "loaded": list(self._voices), "available": available,
+                    "max_loaded": MAX_VOICES}
+
+    def use_voice(self, voice_id: str) -> str:
+        """Make voice_id the default voice, preparing it from VOICES_DIR if needed."""
+        self.get_voice(voice_id)
+        with self._voice_lock:
+            self.active_voice = voice_id
+        return voice_id
+
+    def get_voice(self, voice_id: Optional[str] = None) -> _RefVoice:
+        with self._voice_lock:
+            vid = voice_id or self.active_voice
+            if vid is None:
+                raise RuntimeError("請先 prepare_reference() 準備參考音")
+            voice = self._voices.get(vid)
+            if voice is not None:
+                self._voices.move_to_end(vid)
+                return voice
+        path = self._find_voice_file(vid)
+        if path is None:
+            raise KeyError(f"unknown voice: {vid}")
+        self.prepare_reference(str(path), voice_id=vid, activate=False)
+        with self._voice_lock:
+            return self._voices[vid]
+
+    def _amp_ctx(self):
+        if torch.cuda.is_available():
+            return torch.cuda.amp.autocast(dtype=torch.float16)
+        if self.precision == "bf16":
+            return torch.autocast("cpu", dtype=torch.bfloat16)
+        return nullcontext()
+
+    def _build_voice(self, voice_id: str, file_hash: str, ref_audio: np.ndarray, ref_text: str) -> _RefVoice:
+        """ref_audio: float32 mono at target_sample_rate (from _trim_reference)."""
+        audio = torch.from_numpy(ref_audio).unsqueeze(0)
+        rms = float(torch.sqrt(torch.mean(torch.square(audio))))
+        if rms < target_rms:
+            audio = audio * target_rms / rms
+        audio = audio.to(self.device)
+        with torch.inference_mode(), self._amp_ctx():
+            cond = self.ema_model.mel_spec(audio).permute(0, 2, 1)
+        return _RefVoice(voice_id, file_hash, ref_text, audio, rms, cond)
+
+    def _voice_for(self, ref_text: str, voice_id: Optional[str] = None) -> _RefVoice:
+        voice = self.get_voice(voice_id)
+        if ref_text.strip():
+            voice = voice.with_text(ref_text)
+        return voice
+
+    def _plan_batches(self, durations: List[int]) -> List[List[int]]:
+        """Group item indices by predicted length so padding inside a batch stays small."""
+        order = sorted(range(len(durations)), key=lambda i: durations[i])
+        batches, cur = [], []
+        for i in order:
+            if cur and (len(cur) >= max(1, self.batch_max)
+                        or durations[i] > BATCH_LEN_RATIO * durations[cur[0]]):
+                batches.append(cur)
+                cur = []
+            cur.append(i)
+        if cur:
+            batches.append(cur)
+        return batches
+
+    def _generate_batch(self, voice: _RefVoice, texts: List[str], *, speed: float,
+                        nfe_step: int, seed: Optional[int] = None) -> List[np.ndarray]:
+        """model.sample + vocoder for several texts in one padded forward pass.
+
+        Per-item math matches f5_tts infer_batch_process.process_batch (duration estimate,
+        short-text speed, RMS restore); a batch of one is exactly the single-item path.
+        With a seed, CFM.sample reseeds per item, so the noise does not depend on batching.
+        """
+        final_text_list = convert_char_to_pinyin([voice.ref_text + t for t in texts])
+        durations = [self._duration(voice, t, speed) for t in texts]
+
+        b = len(texts)
+        cond_len = voice.cond.shape[1]
+        t0 = time.perf_counter()
+        generated, _ = self.ema_model.sample(
+            cond=voice.cond.expand(b, -1, -1) if b > 1 else voice.cond,
+            text=final_text_list,
+            duration=(torch.tensor(durations, device=voice.cond.device, dtype=torch.long)
+                      if b > 1 else durations[0]),
+            steps=nfe_step,
+            cfg_strength=cfg_strength,
+            sway_sampling_coef=sway_sampling_coef,
+            seed=seed,
+        )
+        del _
+        generated = generated.to(torch.float32)
+        if self.device == "cuda":
+            torch.cuda.synchronize()   # sample() returns with kernels still queued
+        t1 = time.perf_counter()
+
+        waves = []
+        for i in range(b):
+            # effective length as clamped inside CFM.sample
+            end = min(max(max(len(final_text_list[i]), cond_len) + 1, durations[i]), MAX_DURATION)
+            mel = generated[i:i + 1, voice.ref_len:end, :].permute(0, 2, 1)
+            wave = self.vocoder.decode(mel)
+            if voice.rms < target_rms:
+                wave = wave * voice.rms / target_rms
+            waves.append(wave.squeeze().float().cpu().numpy())
+        metrics.INFER_SEC.observe(t1 - t0, nfe=nfe_step)
+        metrics.VOCODER_SEC.observe(time.perf_counter() - t1)
+        metrics.BATCH_ITEMS.inc(b)
+        self._warm.add(self._shape_key(b, max(durations)))
+        return waves
+
+    @staticmethod
+    def _max_chars(voice: _RefVoice, speed: float) -> int:
+        """chunk_text budget as infer_process derives it from the reference."""
+        return int(voice.ref_text_bytes / voice.seconds * (22 - voice.seconds) * speed)
+
+    @staticmethod
+    def _duration(voice: _RefVoice, text: str, speed: float) -> int:
+        """Predicted total mel frames (reference + generated) for one chunk."""
+        gen_len = len(text.encode("utf-8"))
+        local_speed = 0.3 if gen_len < 10 else speed
+        return voice.ref_len + int(voice.ref_len / voice.ref_text_bytes * gen_len / local_speed)
+
+    def _infer_segments(self, voice: _RefVoice, segments: List[str], *, speed: float, nfe_step: int,
+                        cross_fade_sec: float, seed: Optional[int] = None,
+                        cache_seed: Optional[int] = None, use_cache: bool = True) -> List[np.ndarray]:
+        """Equivalent of infer_process per segment, batched across segments.
+
+        Segments found in the cache are returned as stored (cache_seed: the explicit seed, or
+        None for a random-seed request). The rest are chunked like infer_process (max_chars
+        from the reference), grouped into length-sorted batches, then reassembled per segment
+        with cross-fades and written back to the cache.
+        """
+        keys = [self.cache.make_key(f"{self.precision}|{self.backend}|{voice.cache_tag}", seg, speed=speed, nfe_step=nfe_step,
+                                    cross_fade_sec=cross_fade_sec, seed=cache_seed) if use_cache else None
+                for seg in segments]
+        result: List[Optional[np.ndarray]] = [self.cache.get(k) for k in keys]
+        todo = [si for si, w in enumerate(result) if w is None]
+        metrics.SEGMENTS.inc(len(segments) - len(todo), source="cache")
+        metrics.SEGMENTS.inc(len(todo), source="model")
+        if not todo:
+            return result
+
+        max_chars = self._max_chars(voice, speed)
+        items = [(si, t) for si in todo for t in chunk_text(segments[si], max_chars=max_chars)]
+        texts = [t for _, t in items]
+        est = [max(1, len(t.encode("utf-8"))) for t in texts]
+
+        outs: List[Optional[np.ndarray]] = [None] * len(items)
+        for idx in self._plan_batches(est):
+            for i, w in zip(idx, self._generate_batch(voice, [texts[i] for i in idx],
+                                                      speed=speed, nfe_step=nfe_step, seed=seed)):
+                outs[i] = w
+
+        per_seg: dict = {si: [] for si in todo}
+        for (si, _), w in zip(items, outs):
+            per_seg[si].append(w)
+        for si in todo:
+            result[si] = _cross_fade_join(per_seg[si], cross_fade_sec)
+            self.cache.put(keys[si], result[si])
+        return result
+
+    def _reload_swaps_if_changed(self):
+        now = time.monotonic()
+        if SWAPS_CHECK_SEC <= 0 or now - self._swaps_checked < SWAPS_CHECK_SEC:
+            return
+        self._swaps_checked = now
+        try:
+            mtime = SWAPS_PATH.stat().st_mtime if SWAPS_PATH.is_file() else 0.0
+            if mtime != self._swap_rules.mtime:
+                self._swap_rules = load_swaps(SWAPS_PATH)
+                print(f"OK swaps reloaded: {SWAPS_PATH} ({len(self._swap_rules)} rules, "
+                      f"{len(self._swap_rules.stages)} passes)")
+        except Exception as e:
+            print(f"[WARN] swaps reload failed, keeping previous rules: {e}")
 
-        # Fades
-        if REF_FADEIN_MS > 0:
-            audio = audio.fade_in(REF_FADEIN_MS)
-        if REF_FADEOUT_MS > 0:
-            audio = audio.fade_out(REF_FADEOUT_MS)
+    def _process_text(self, text: str, *, strip_meta=True) -> List[str]:
+        with metrics.TEXT_SEC.time():
+            self._reload_swaps_if_changed()
+            return list(_frontend(text or "", bool(strip_meta), self._swap_rules))
+
+    @staticmethod
+    def text_cache_info():
+        """functools cache_info() of the processed-text LRU."""
+        return _frontend.cache_info()
+
+    def _begin_request(self, text: str, *, strip_meta: bool, seed: int, ref_text: str,
+                       voice: Optional[str]):
+        if not self.prepared and voice is None:
+            raise RuntimeError("請先 prepare_reference() 準備參考音")
+        if not text or not text.strip():
+            raise ValueError("text 不可為空")
 
-        audio.export(self.ref_wav_path, format="wav")
-        self.prepared = True
-        print("Ref ready (trimmed + tail pad).")
+        lines = self._process_text(text, strip_meta=strip_meta)
+        if not lines:
+            raise ValueError("處理後文字為空")
 
-    def _process_text(self, text: str, *, strip_meta=True) -> List[str]:
-        t = (text or "").strip()
-        if strip_meta:
-            t = _strip_directives(t)
-        t = _normalize_text(t)
-        t2 = _apply_swaps(t, self._swap_rules)
-        return _smart_segment(t2, CHUNK_MIN, CHUNK_MAX)
+        if seed < 0 or seed > 2**31 - 1:
+            seed = int(np.random.randint(0, 2**31 - 1))
+        return lines, seed, self._voice_for(ref_text or "", voice)
+
+    def synthesize_stream(self,
+                          text: str,
+                          *,
+                          speed: float = DEFAULT_SPEED,
+                          nfe_step: int = DEFAULT_NFE,
+                          cross_fade_sec: float = DEFAULT_XFADE,
+                          pause_ms: int = DEFAULT_PAUSEMS,
+                          ref_text: str = "",
+                          strip_meta: bool = True,
+                          seed: int = -1,
+                          voice: Optional[str] = None,
+                          use_cache: bool = True) -> Iterator[np.ndarray]:
+        """Yield float32 audio per segment (at sample_rate) as soon as each one is generated.
+
+        The first segment runs alone so time-to-first-audio is one sentence; the rest run in
+        batches of batch_max. Pauses are prepended to every chunk after the first, and the
+        lead trim / fade-in / fade-out are applied to the first and last chunks, so the
+        concatenated chunks match synthesize() (lead trim judges against the first segment's peak).
+        """
+        explicit_seed = seed if 0 <= seed <= 2**31 - 1 else None
+        lines, seed, ref_voice = self._begin_request(text, strip_meta=strip_meta, seed=seed,
+                                                     ref_text=ref_text, voice=voice)
+        sr = target_sample_rate
+        gap = int(sr * max(0, pause_ms) / 1000.0) if pause_ms > 0 else 0
+        groups = [lines[:1]] + [lines[i:i + max(1, self.batch_max)] for i in range(1, len(lines), max(1, self.batch_max))]
+        done = 0
+        for group in groups:
+            if not group:
+                continue
+            with self._infer_lock, torch.inference_mode():
+                with self._amp_ctx():
+                    waves = self._infer_segments(
+                        ref_voice, group,
+                        speed=float(speed),
+                        nfe_step=int(nfe_step),
+                        cross_fade_sec=float(cross_fade_sec),
+                        seed=seed,
+                        cache_seed=explicit_seed,
+                        use_cache=use_cache,
+                    )
+            for w in waves:
+                w = _join_with_pauses([w], gap, lead_gap=done > 0)
+                if done == 0:
+                    w = _trim_lead(w, sr, float(np.max(np.abs(w))) if len(w) else 0.0)
+                    _fade(w, sr, OUT_FADEIN_MS, head=True)
+                if done == len(lines) - 1:
+                    _fade(w, sr, OUT_FADEOUT_MS, head=False)
+                done += 1
+                metrics.AUDIO_SEC.inc(len(w) / sr)
+                yield w
+
+    @property
+    def sample_rate(self) -> int:
+        return target_sample_rate
 
     def synthesize(self,
                    text: str,
@@ -218,84 +777,126 @@ class TTSManager:
                    strip_meta: bool = True,
                    taiwan_accent: bool = True,   # kept for compatibility (ignored)
                    remove_silence: bool = REMOVE_SIL_DEF,
-                   seed: int = -1) -> str:
-        """Synthesize to output_path and return the actual path."""
-        if not self.prepared:
-            raise RuntimeError("請先 prepare_reference() 準備參考音")
-        if not text or not text.strip():
-            raise ValueError("text 不可為空")
-
-        lines = self._process_text(text, strip_meta=strip_meta)
-        if not lines:
-            raise ValueError("處理後文字為空")
-
-        if seed < 0 or seed > 2**31 - 1:
-            seed = int(np.random.randint(0, 2**31 - 1))
-        torch.manual_seed(seed)
-
-        ref_audio_ready, ref_text_ready = preprocess_ref_audio_text(self.ref_wav_path, ref_text or "")
-        waves, sr_final = [], 24000
-
-        use_amp = torch.cuda.is_available()
-        amp_dtype = torch.float16
-        with torch.inference_mode():
-            ctx = torch.cuda.amp.autocast(dtype=amp_dtype) if use_amp else nullcontext()
-            with ctx:
-                for seg in lines:
-                    w, sr, _ = infer_process(
-                        ref_audio_ready, ref_text_ready, seg,
-                        self.ema_model, self.vocoder,
-                        cross_fade_duration=float(cross_fade_sec),
-                        nfe_step=int(nfe_step),
-                        speed=float(speed),
-                        show_info=lambda *a, **k: None,
-                        progress=None,
-                    )
-                    sr_final = sr
-                    waves.append(w)
-
+                   seed: int = -1,
+                   voice: Optional[str] = None,
+                   use_cache: bool = True) -> str:
+        """Synthesize to output_path and return the actual path (voice=None: active voice)."""
+        result = self.synthesize_batch([dict(
+            text=text, output_path=output_path, speed=speed, nfe_step=nfe_step,
+            cross_fade_sec=cross_fade_sec, pause_ms=pause_ms, ref_text=ref_text,
+            strip_meta=strip_meta, seed=seed, voice=voice, use_cache=use_cache,
+        )])[0]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def warmup(self, text: str = "嗨", *, voice: Optional[str] = None, ref_text: str = "",
+               speed: float = DEFAULT_SPEED, **kwargs) -> bool:
+        """Synthesize text in memory unless its input shape is already warm; True if a pass ran.
+
+        Every model pass marks its shape (_shape_key), so after a voice switch this only runs
+        when the new reference moves the warmup text into a length bucket that has not run yet.
+        """
+        ref_voice = self._voice_for(ref_text, voice)
+        lines = self._process_text(text, strip_meta=kwargs.get("strip_meta", True))
+        chunks = [t for ln in lines for t in chunk_text(ln, max_chars=self._max_chars(ref_voice, speed))]
+        if chunks and all(self._shape_key(1, self._duration(ref_voice, t, speed)) in self._warm
+                          for t in chunks):
+            return False
+        t0 = time.perf_counter()
+        with metrics.suppressed():   # synthetic pass: keep it out of the production timings
+            result = self.synthesize_batch([dict(text=text, voice=voice, ref_text=ref_text, speed=speed,
+                                                 use_cache=False, **kwargs)])[0]
+        if isinstance(result, Exception):
+            raise result
+        metrics.WARMUP_SEC.observe(time.perf_counter() - t0)
+        return True
+
+    def synthesize_batch(self, requests: List[dict]) -> list:
+        """Synthesize several requests together; returns an output path or Exception per request.
+
+        Each request dict takes synthesize()'s keyword names (text required). Without an
+        output_path the finished float32 waveform (at sample_rate) is returned instead of a path.
+        Requests that share voice, nfe_step, speed and cross-fade (and seed, if one was given
+        explicitly) are merged into one _infer_segments call so their segments share batches.
+        """
+        results: list = [None] * len(requests)
+        groups: "OrderedDict[tuple, list]" = OrderedDict()
+        plans = {}
+        for i, r in enumerate(requests):
+            try:
+                raw_seed = int(r.get("seed", -1))
+                lines, seed, ref_voice = self._begin_request(
+                    r["text"], strip_meta=r.get("strip_meta", True), seed=raw_seed,
+                    ref_text=r.get("ref_text", ""), voice=r.get("voice"))
+            except Exception as e:
+                results[i] = e
+                continue
+            opts = (float(r.get("speed", DEFAULT_SPEED)), int(r.get("nfe_step", DEFAULT_NFE)),
+                    float(r.get("cross_fade_sec", DEFAULT_XFADE)))
+            explicit_seed = seed if 0 <= raw_seed <= 2**31 - 1 else None
+            use_cache = bool(r.get("use_cache", True))
+            groups.setdefault((id(ref_voice), *opts, explicit_seed, use_cache), []).append(i)
+            plans[i] = (lines, seed, ref_voice, opts)
+
+        for (*_, explicit_seed, use_cache), idxs in groups.items():
+            _, seed, ref_voice, (speed, nfe_step, cross_fade_sec) = plans[idxs[0]]
+            segments = [ln for i in idxs for ln in plans[i][0]]
+            try:
+                with self._infer_lock, torch.inference_mode():
+                    with self._amp_ctx():
+                        waves = self._infer_segments(
+                            ref_voice, segments,
+                            speed=speed,
+                            nfe_step=nfe_step,
+                            cross_fade_sec=cross_fade_sec,
+                            seed=seed,
+                            cache_seed=explicit_seed,
+                            use_cache=use_cache,
+                        )
+            except Exception as e:
+                for i in idxs:
+                    results[i] = e
+                continue
+            pos = 0
+            for i in idxs:
+                n = len(plans[i][0])
+                r = requests[i]
+                try:
+                    results[i] = self._finish(waves[pos:pos + n], int(r.get("pause_ms", DEFAULT_PAUSEMS)),
+                                              r.get("output_path"))
+                except Exception as e:
+                    results[i] = e
+                pos += n
+        return results
+
+    def _finish(self, waves: List[np.ndarray], pause_ms: int, output_path: Optional[str]):
+        """Join segment waves with pauses, trim/fade, and write the wav (or return it if no path).
+
+        Segments and pauses are written once into a preallocated float32 buffer; the lead trim
+        is a view and the fades work in place, so a long narration is never copied again.
+        """
+        sr_final = target_sample_rate
         if not waves:
             raise RuntimeError("無法生成音訊，請檢查輸入")
 
-        gap = np.zeros(int(sr_final * (max(0, pause_ms) / 1000.0)), dtype=waves[0].dtype) if pause_ms > 0 else None
-        parts = []
-        for i, w in enumerate(waves):
-            parts.append(w)
-            if gap is not None and i < len(waves) - 1:
-                parts.append(gap)
-        final_wave = np.concatenate(parts) if len(parts) > 1 else waves[0]
-
-        if TRIM_LEAD_MS > 0 and len(final_wave) > 0:
-            sr = sr_final
-            n = min(len(final_wave), int(sr * TRIM_LEAD_MS / 1000))
-            if n > 8:
-                head = final_wave[: n // 2]
-                peak = np.max(np.abs(final_wave))
-                if peak > 0 and np.max(np.abs(head)) < LEAD_REL_EPS * peak:
-                    final_wave = final_wave[n:]
-                    print(f"Trim head {TRIM_LEAD_MS} ms low-energy")
-
-        if OUT_FADEIN_MS > 0 and len(final_wave) > 0:
-            sr = sr_final
-            m = min(len(final_wave), int(sr * OUT_FADEIN_MS / 1000))
-            if m > 1:
-                ramp = np.linspace(0.0, 1.0, m, dtype=np.float32)
-                x = final_wave.astype(np.float32)
-                x[:m] = x[:m] * ramp
-                final_wave = x.astype(final_wave.dtype)
-                print(f"Fade-in {OUT_FADEIN_MS} ms")
-
-        if OUT_FADEOUT_MS > 0 and len(final_wave) > 0:
-            sr = sr_final
-            m = min(len(final_wave), int(sr * OUT_FADEOUT_MS / 1000))
-            if m > 1:
-                ramp = np.linspace(1.0, 0.0, m, dtype=np.float32)
-                x = final_wave.astype(np.float32)
-                x[-m:] = x[-m:] * ramp
-                final_wave = x.astype(final_wave.dtype)
-                print(f"Fade-out {OUT_FADEOUT_MS} ms")
-
-        Path(output_path).parent.mkdir(parents=True, exist_ok=True)
-        sf.write(output_path, final_wave, sr_final)
+        t0 = time.perf_counter()
+        gap = int(sr_final * (max(0, pause_ms) / 1000.0)) if pause_ms > 0 else 0
+        peak = max((float(np.max(np.abs(w))) for w in waves if len(w)), default=0.0)
+        final_wave = _join_with_pauses(waves, gap)
+
+        n_before = len(final_wave)
+        final_wave = _trim_lead(final_wave, sr_final, peak)
+        if len(final_wave) != n_before:
+            print(f"Trim head {TRIM_LEAD_MS} ms low-energy")
+        _fade(final_wave, sr_final, OUT_FADEIN_MS, head=True)
+        _fade(final_wave, sr_final, OUT_FADEOUT_MS, head=False)
+        metrics.POST_SEC.observe(time.perf_counter() - t0)
+        metrics.AUDIO_SEC.inc(len(final_wave) / sr_final)
+
+        if not output_path:
+            return final_wave
+        with metrics.WRITE_SEC.time():
+            _write_wav_atomic(output_path, final_wave, sr_final)
         print(f"OK wrote: {output_path}")
         return output_path
\ No newline at end of file
@@ -0,0 +1,56 @@
+# filename: bench_backend.py
+# Benchmark + parity check: eager vs torch.compile backend (F5TTS_BACKEND=compile).
+# Same texts and seed through both; reports first-call (compile or cache load) time, steady RTF,
+# and parity against eager (max |diff| of the waveforms, mean log-mel L1). Exit code 1 if parity fails.
+# Usage:  python bench_backend.py --ref voices/default.wav [--runs 3] [--mel-tol 0.05]
+
+import argparse, os, sys, time
+from pathlib import Path
+
+import numpy as np
+
+from TTS_Manager import TTSManager, DEFAULT_NFE
+from tts_cache import SegmentCache
+from bench_cpu import _TEXTS, _mel_distance, _synth_all
+
+def _load(backend: str, args) -> tuple:
+    tts = TTSManager(backend=backend)
+    tts.cache = SegmentCache(max_mb=0)   # measure inference, not cache hits
+    tts.prepare_reference(args.ref, ref_text=args.ref_text)
+    t0 = time.perf_counter()
+    tts.synthesize_batch([dict(text="嗨。", nfe_step=args.nfe, seed=1)])   # compiles (or loads cached kernels)
+    return tts, time.perf_counter() - t0
+
+def main():
+    ap = argparse.ArgumentParser(description="F5-TTS eager vs torch.compile: RTF and output parity")
+    ap.add_argument("--ref", default=os.getenv("REF_WAV", str(Path(__file__).parent / "voices" / "default.wav")))
+    ap.add_argument("--ref-text", default=os.getenv("DEFAULT_REF_TEXT", ""))
+    ap.add_argument("--runs", type=int, default=3)
+    ap.add_argument("--nfe", type=int, default=DEFAULT_NFE)
+    ap.add_argument("--mel-tol", type=float, default=0.05, help="max mean log-mel L1 vs eager")
+    args = ap.parse_args()
+
+    results = {}
+    for backend in ("eager", "compile"):
+        tts, first = _load(backend, args)
+        sec, audio, waves = _synth_all(tts, nfe=args.nfe, runs=args.runs)
+        results[backend] = (tts, first, sec, audio, waves)
+        print(f"{tts.backend:>8}: first call {first:6.2f}s | synth {sec:6.2f}s for {audio:6.2f}s audio "
+              f"| RTF {sec / audio:.3f}")
+
+    eager, comp = results["eager"], results["compile"]
+    print(f"speedup: {eager[2] / comp[2]:.2f}x")
+    ok = True
+    for text, a, b in zip(_TEXTS, eager[4], comp[4]):
+        n = min(len(a), len(b))
+        diff = float(np.max(np.abs(a[:n] - b[:n]))) if n else 0.0
+        mel = _mel_distance(eager[0], a, b)
+        same_len = len(a) == len(b)
+        ok &= same_len and mel <= args.mel_tol
+        print(f"  len {len(a):>7}/{len(b):<7} max|d| {diff:.4f} mel L1 {mel:.4f} {'OK' if same_len and mel <= args.mel_tol else 'FAIL'}"
+              f"  {text[:12]}")
+    print("parity:", "OK" if ok else "FAIL")
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
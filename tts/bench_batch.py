@@ -0,0 +1,64 @@
+# filename: bench_batch.py
+# Benchmark: sequential (batch_max=1) vs batched segment inference in TTSManager.synthesize.
+# Usage:  python bench_batch.py --ref voices/default.wav [--segments 1 5 20] [--runs 3] [--nfe 16]
+
+import argparse, os, time, tempfile
+from pathlib import Path
+
+import numpy as np
+import soundfile as sf
+
+from TTS_Manager import TTSManager
+from tts_cache import SegmentCache
+
+# ~90 chars per line so _smart_segment (CHUNK_MAX=160) keeps one line per segment
+_LINE = "今天下午我們一起去公園散步，天氣很好，風也很涼快，路上還遇到以前的鄰居，大家聊了好久才回家，晚上再一起吃飯。"
+
+def _text(n: int) -> str:
+    return "\n".join(f"第{i + 1}段。{_LINE}" for i in range(n))
+
+def _run(tts: TTSManager, text: str, out: str, *, nfe: int, runs: int) -> float:
+    best = float("inf")
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        tts.synthesize(text, out, nfe_step=nfe, seed=1234, pause_ms=400)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def main():
+    ap = argparse.ArgumentParser(description="F5-TTS batched vs sequential segment inference")
+    ap.add_argument("--ref", default=os.getenv("REF_WAV", str(Path(__file__).parent / "voices" / "default.wav")))
+    ap.add_argument("--ref-text", default=os.getenv("DEFAULT_REF_TEXT", ""))
+    ap.add_argument("--segments", type=int, nargs="+", default=[1, 5, 20])
+    ap.add_argument("--runs", type=int, default=3)
+    ap.add_argument("--nfe", type=int, default=int(os.getenv("F5TTS_NFE", "16")))
+    ap.add_argument("--batch-max", type=int, default=None, help="batched mode batch size (default: F5TTS_BATCH_MAX)")
+    args = ap.parse_args()
+
+    tts = TTSManager()
+    tts.cache = SegmentCache(max_mb=0)   # measure inference, not cache hits
+    tts.prepare_reference(args.ref, ref_text=args.ref_text)
+    batched = args.batch_max or tts.batch_max
+    tmp = Path(tempfile.mkdtemp(prefix="bench_batch_"))
+
+    # warm both paths once so kernel compilation is not measured
+    for bm in (1, batched):
+        tts.batch_max = bm
+        tts.synthesize("嗨，你好。", str(tmp / "warm.wav"), nfe_step=args.nfe, seed=1)
+
+    print(f"{'segments':>8} {'seq s':>8} {'batch s':>8} {'speedup':>8} {'len diff':>9} {'max |d|':>8}")
+    for n in args.segments:
+        text = _text(n)
+        n_seg = len(tts._process_text(text))
+        tts.batch_max = 1
+        t_seq = _run(tts, text, str(tmp / "seq.wav"), nfe=args.nfe, runs=args.runs)
+        tts.batch_max = batched
+        t_bat = _run(tts, text, str(tmp / "bat.wav"), nfe=args.nfe, runs=args.runs)
+        a, _ = sf.read(tmp / "seq.wav", dtype="float32")
+        b, _ = sf.read(tmp / "bat.wav", dtype="float32")
+        m = min(len(a), len(b))
+        diff = float(np.max(np.abs(a[:m] - b[:m]))) if m else 0.0
+        print(f"{n_seg:>8} {t_seq:>8.2f} {t_bat:>8.2f} {t_seq / t_bat:>7.2f}x {len(a) - len(b):>9} {diff:>8.4f}")
+
+if __name__ == "__main__":
+    main()
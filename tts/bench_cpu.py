@@ -0,0 +1,75 @@
+# filename: bench_cpu.py
+# Benchmark: CPU inference precision (fp32 / int8 / bf16) x intra-op threads.
+# Reports RTF (synthesis seconds / audio seconds) and a quality check: mean L1 distance of
+# log-mel spectrograms against the fp32 output for the same text and seed.
+# Usage:  python bench_cpu.py --ref voices/default.wav [--modes fp32 int8 bf16] [--threads 4 8] [--runs 3]
+
+import argparse, os, time
+from pathlib import Path
+
+import numpy as np
+import torch
+
+from TTS_Manager import TTSManager, DEFAULT_NFE
+from tts_cache import SegmentCache
+
+_TEXTS = [
+    "嗨，你好。",
+    "今天下午我們一起去公園散步，天氣很好，風也很涼快。",
+    "路上還遇到以前的鄰居，大家聊了好久才回家，晚上再一起吃飯，順便討論下個月要去哪裡玩。",
+]
+
+def _log_mel(tts: TTSManager, wave: np.ndarray) -> torch.Tensor:
+    with torch.inference_mode():
+        x = torch.from_numpy(np.ascontiguousarray(wave, dtype=np.float32))[None]
+        return tts.ema_model.mel_spec(x).squeeze(0).float()   # already log-compressed
+
+def _mel_distance(tts: TTSManager, a: np.ndarray, b: np.ndarray) -> float:
+    ma, mb = _log_mel(tts, a), _log_mel(tts, b)
+    n = min(ma.shape[-1], mb.shape[-1])
+    return float((ma[..., :n] - mb[..., :n]).abs().mean())
+
+def _synth_all(tts: TTSManager, *, nfe: int, runs: int):
+    """Best-of-runs wall time and total audio seconds over _TEXTS; returns (seconds, audio_sec, waves)."""
+    best, waves = float("inf"), []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        waves = [tts.synthesize_batch([dict(text=t, nfe_step=nfe, seed=1234, pause_ms=0)])[0] for t in _TEXTS]
+        best = min(best, time.perf_counter() - t0)
+    for w in waves:
+        if isinstance(w, Exception):
+            raise w
+    audio = sum(len(w) for w in waves) / tts.sample_rate
+    return best, audio, waves
+
+def main():
+    ap = argparse.ArgumentParser(description="F5-TTS CPU precision / thread benchmark")
+    ap.add_argument("--ref", default=os.getenv("REF_WAV", str(Path(__file__).parent / "voices" / "default.wav")))
+    ap.add_argument("--ref-text", default=os.getenv("DEFAULT_REF_TEXT", ""))
+    ap.add_argument("--modes", nargs="+", default=["fp32", "int8", "bf16"])
+    ap.add_argument("--threads", type=int, nargs="+", default=[torch.get_num_threads()])
+    ap.add_argument("--runs", type=int, default=2)
+    ap.add_argument("--nfe", type=int, default=DEFAULT_NFE)
+    args = ap.parse_args()
+    if torch.cuda.is_available():
+        print("[WARN] CUDA is available; hide it (CUDA_VISIBLE_DEVICES=) to benchmark the CPU path")
+
+    reference = None   # fp32 waves at the first thread count
+    print(f"{'mode':>5} {'threads':>7} {'synth s':>8} {'audio s':>8} {'RTF':>6} {'mel L1':>7}")
+    for mode in args.modes:
+        tts = TTSManager(cpu_precision=mode)
+        tts.cache = SegmentCache(max_mb=0)   # measure inference, not cache hits
+        tts.prepare_reference(args.ref, ref_text=args.ref_text)
+        for n in args.threads:
+            torch.set_num_threads(n)
+            tts.synthesize_batch([dict(text="嗨。", nfe_step=args.nfe, seed=1)])   # warm
+            sec, audio, waves = _synth_all(tts, nfe=args.nfe, runs=args.runs)
+            if reference is None and tts.precision == "fp32":
+                reference = waves
+            dist = (np.mean([_mel_distance(tts, a, b) for a, b in zip(reference, waves)])
+                    if reference is not None else float("nan"))
+            print(f"{tts.precision:>5} {n:>7} {sec:>8.2f} {audio:>8.2f} {sec / audio:>6.2f} {dist:>7.3f}")
+        del tts
+
+if __name__ == "__main__":
+    main()
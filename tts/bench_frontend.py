@@ -0,0 +1,61 @@
+# filename: bench_frontend.py
+# Benchmark: TTS text front-end (directives, normalise, swaps, segment) with many swap rules.
+# Compares rule-by-rule swaps vs the compiled tts_swaps.SwapTable, and cold vs LRU-cached _frontend.
+# Usage:  python bench_frontend.py [--rules 100 300 1000] [--texts 2000]
+
+import argparse, random, tempfile, time
+from pathlib import Path
+
+import TTS_Manager as tm
+from tts_swaps import load_swaps, apply_swaps
+
+_BASE = ("今天下午我們一起去銀行辦事，感覺行情不錯，你覺得呢？"
+         "（語氣自然）晚上再調整一下行程，接著去公園散步～")
+
+def _synthetic_rules(path: Path, n: int, seed: int = 0) -> Path:
+    """Real swaps.txt followed by n random literal rules (2-4 CJK chars each)."""
+    rng = random.Random(seed)
+    cjk = [chr(c) for c in range(0x4E00, 0x4E00 + 800)]
+    lines = [tm.SWAPS_PATH.read_text(encoding="utf-8")] if tm.SWAPS_PATH.is_file() else []
+    for _ in range(n):
+        pat = "".join(rng.choice(cjk) for _ in range(rng.randint(2, 4)))
+        lines.append(f"{pat} => {''.join(rng.choice(cjk) for _ in range(len(pat)))}")
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return path
+
+def _texts(n: int, seed: int = 1) -> list:
+    rng = random.Random(seed)
+    cjk = [chr(c) for c in range(0x4E00, 0x4E00 + 800)]
+    return [_BASE + "".join(rng.choice(cjk) for _ in range(rng.randint(10, 80))) + "。" for _ in range(n)]
+
+def _rate(fn, texts) -> float:
+    t0 = time.perf_counter()
+    for t in texts:
+        fn(t)
+    return len(texts) / (time.perf_counter() - t0)
+
+def main():
+    ap = argparse.ArgumentParser(description="TTS text front-end throughput")
+    ap.add_argument("--rules", type=int, nargs="+", default=[0, 100, 300, 1000],
+                    help="extra synthetic rules on top of swaps.txt")
+    ap.add_argument("--texts", type=int, default=2000)
+    args = ap.parse_args()
+
+    texts = _texts(args.texts)
+    tmp = Path(tempfile.mkdtemp(prefix="bench_frontend_"))
+    print(f"{'rules':>6} {'passes':>6} {'seq/s':>9} {'compiled/s':>11} {'speedup':>8} {'cached/s':>10} {'same':>5}")
+    for n in args.rules:
+        table = load_swaps(_synthetic_rules(tmp / f"swaps_{n}.txt", n))
+        same = all(apply_swaps(t, table.rules) == table.apply(t) for t in texts[:200])
+        seq = _rate(lambda t: apply_swaps(t, table.rules), texts)
+        comp = _rate(table.apply, texts)
+        tm._frontend.cache_clear()
+        for t in texts:                       # fill the LRU (maxsize F5TTS_TEXT_CACHE)
+            tm._frontend(t, True, table)
+        hot = texts[-tm.TEXT_CACHE_SIZE:]      # most recent entries are the ones still cached
+        cached = _rate(lambda t: tm._frontend(t, True, table), hot)
+        print(f"{len(table):>6} {len(table.stages):>6} {seq:>9.0f} {comp:>11.0f} {comp / seq:>7.1f}x "
+              f"{cached:>10.0f} {str(same):>5}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+# filename: bench_stt.py
+# Benchmark: STT pool throughput (clips/sec) vs replicas, with and without short-clip batching.
+# Clips are cut from the given recordings (resampled to 16 kHz mono) and submitted concurrently.
+# Usage:  python bench_stt.py --audio a.wav b.wav [--clip-sec 4] [--clips 64] [--replicas 1 2 4] [--cpu-threads 2]
+
+import argparse, os, time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import soundfile as sf
+from faster_whisper import WhisperModel
+
+from stt_pool import STTPool, STT_SR, STT_CPU_THREADS
+
+def _load_clips(paths, clip_sec: float, n: int) -> list:
+    pieces, size = [], int(clip_sec * STT_SR)
+    for p in paths:
+        x, sr = sf.read(p, dtype="float32", always_2d=True)
+        x = x.mean(axis=1)
+        if sr != STT_SR:
+            m = int(round(len(x) * STT_SR / sr))
+            x = np.interp(np.arange(m) * (sr / STT_SR), np.arange(len(x)), x).astype(np.float32)
+        pieces += [x[i:i + size] for i in range(0, len(x) - size + 1, size)]
+    if not pieces:
+        raise SystemExit(f"no {clip_sec}s clips in {paths}")
+    return [pieces[i % len(pieces)] for i in range(n)]
+
+def main():
+    ap = argparse.ArgumentParser(description="faster-whisper pool throughput")
+    ap.add_argument("--audio", nargs="+", required=True)
+    ap.add_argument("--clip-sec", type=float, default=4.0)
+    ap.add_argument("--clips", type=int, default=64)
+    ap.add_argument("--replicas", type=int, nargs="+", default=[1, 2, 4])
+    ap.add_argument("--cpu-threads", type=int, default=STT_CPU_THREADS)
+    ap.add_argument("--size", default=os.getenv("WHISPER_SIZE", "small"))
+    ap.add_argument("--device", default=os.getenv("WHISPER_DEVICE", "cpu"))
+    ap.add_argument("--compute-type", default=os.getenv("WHISPER_TYPE", "int8"))
+    ap.add_argument("--concurrency", type=int, default=16, help="client threads submitting clips")
+    args = ap.parse_args()
+
+    clips = _load_clips(args.audio, args.clip_sec, args.clips)
+    factory = lambda: WhisperModel(args.size, device=args.device, compute_type=args.compute_type,
+                                   cpu_threads=args.cpu_threads, num_workers=1)
+    print(f"{args.clips} clips x {args.clip_sec}s | {args.size} {args.device}/{args.compute_type} "
+          f"| cpu_threads/replica={args.cpu_threads or 'default'}")
+    print(f"{'replicas':>8} {'batch':>5} {'sec':>7} {'clips/s':>8} {'audio x RT':>10} {'batched':>8}")
+    for r in args.replicas:
+        for max_batch in (1, 8):
+            pool = STTPool(factory, replicas=r, max_queue=args.clips, max_batch=max_batch)
+            pool.transcribe(clips[0])   # warm one replica
+            t0 = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.concurrency) as ex:
+                list(ex.map(pool.transcribe, clips))
+            dt = time.perf_counter() - t0
+            st = pool.stats()
+            print(f"{r:>8} {max_batch:>5} {dt:>7.2f} {len(clips) / dt:>8.2f} "
+                  f"{len(clips) * args.clip_sec / dt:>10.1f} {st['batched_clips']:>8}")
+            pool.close()
+
+if __name__ == "__main__":
+    main()
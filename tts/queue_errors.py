@@ -0,0 +1,7 @@
+# filename: queue_errors.py
+# Admission errors shared by the TTS scheduler and the STT pool (no model imports, so STT-only
+# tools such as bench_stt.py do not pull in torch / f5_tts).
+
+
+class QueueFull(Exception):
+    """Raised when a request queue is at capacity (HTTP 429)."""
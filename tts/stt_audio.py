@@ -0,0 +1,79 @@
+# filename: stt_audio.py
+# Upload decoding for STT: file-like -> float32 16 kHz mono in one pass.
+# soundfile decodes block by block straight from the stream, each block is down-mixed and pushed
+# through one soxr streaming resampler into a preallocated output, so the full-rate (and float64)
+# copy of a long recording never exists. Formats libsndfile cannot read fall back to PyAV
+# (faster_whisper.decode_audio), which also yields 16 kHz mono float32.
+
+import os
+from typing import BinaryIO
+
+import numpy as np
+import soundfile as sf
+import soxr
+
+STT_SR          = 16000
+STT_MAX_SEC     = float(os.getenv("STT_MAX_SEC", "300"))
+STT_MAX_UPLOAD_MB = float(os.getenv("STT_MAX_UPLOAD_MB", "50"))
+DECODE_BLOCK    = 64 * 1024   # frames per soundfile read
+
+
+class AudioTooLong(ValueError):
+    """Upload exceeds STT_MAX_SEC (HTTP 413)."""
+
+
+class StreamResampler:
+    """Chunked mono resampling to STT_SR (state carried across chunks; identity at 16 kHz)."""
+
+    def __init__(self, sr: int):
+        self.sr = int(sr)
+        self._rs = soxr.ResampleStream(self.sr, STT_SR, 1, dtype="float32") if self.sr != STT_SR else None
+
+    def __call__(self, x: np.ndarray, last: bool = False) -> np.ndarray:
+        x = np.asarray(x, dtype=np.float32)
+        return x if self._rs is None else self._rs.resample_chunk(x, last=last)
+
+
+def _mono(block: np.ndarray) -> np.ndarray:
+    return block[:, 0] if block.shape[1] == 1 else block.mean(axis=1, dtype=np.float32)
+
+
+def decode_to_16k(f: BinaryIO, max_sec: float = STT_MAX_SEC) -> np.ndarray:
+    """Decode an uploaded file object to float32 16 kHz mono; raises AudioTooLong past max_sec."""
+    try:
+        snd = sf.SoundFile(f)
+    except (sf.LibsndfileError, RuntimeError):
+        f.seek(0)
+        return _decode_av(f, max_sec)
+    with snd:
+        if snd.frames > 0 and max_sec > 0 and snd.frames / snd.samplerate > max_sec:
+            raise AudioTooLong(f"audio is {snd.frames / snd.samplerate:.0f}s, limit {max_sec:.0f}s")
+        rs = StreamResampler(snd.samplerate)
+        cap = int(max_sec * STT_SR) if max_sec > 0 else 0
+        est = int(np.ceil(snd.frames * STT_SR / snd.samplerate)) + 1024 if snd.frames > 0 else STT_SR
+        out = np.empty(est, dtype=np.float32)
+        n = 0
+
+        def put(y: np.ndarray):
+            nonlocal out, n
+            if n + len(y) > len(out):   # frame count unknown or off: grow
+                bigger = np.empty(max(n + len(y), 2 * len(out)), dtype=np.float32)
+                bigger[:n] = out[:n]
+                out = bigger
+            out[n:n + len(y)] = y
+            n += len(y)
+
+        for block in snd.blocks(blocksize=DECODE_BLOCK, dtype="float32", always_2d=True):
+            put(rs(_mono(block)))
+            if cap and n > cap:
+                raise AudioTooLong(f"audio exceeds {max_sec:.0f}s")
+        put(rs(np.zeros(0, dtype=np.float32), last=True))
+        return out[:n]
+
+
+def _decode_av(f: BinaryIO, max_sec: float) -> np.ndarray:
+    from faster_whisper.audio import decode_audio
+    audio = decode_audio(f, sampling_rate=STT_SR)
+    if max_sec > 0 and len(audio) > max_sec * STT_SR:
+        raise AudioTooLong(f"audio is {len(audio) / STT_SR:.0f}s, limit {max_sec:.0f}s")
+    return audio
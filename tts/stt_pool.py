@@ -0,0 +1,154 @@
+# filename: stt_pool.py
+# faster-whisper worker pool: STT_REPLICAS model replicas (cpu_threads each) pull from one bounded
+# queue. A worker that finds several short clips queued within STT_BATCH_WINDOW_MS transcribes them
+# in one encoder/decoder batch (CTranslate2 generate over padded 30 s features); longer clips, or
+# any batch failure, go through the regular WhisperModel.transcribe.
+
+import os, time, queue, threading
+from typing import Callable, List, Optional
+
+import numpy as np
+
+from queue_errors import QueueFull
+
+STT_REPLICAS        = int(os.getenv("STT_REPLICAS", "1"))
+STT_CPU_THREADS     = int(os.getenv("STT_CPU_THREADS", "0"))      # per replica; 0 = ctranslate2 default
+STT_QUEUE_MAX       = int(os.getenv("STT_QUEUE_MAX", "32"))
+STT_BATCH_WINDOW_MS = float(os.getenv("STT_BATCH_WINDOW_MS", "10"))
+STT_BATCH_MAX       = int(os.getenv("STT_BATCH_MAX", "8"))        # 1 disables batching
+STT_BATCH_MAX_SEC   = float(os.getenv("STT_BATCH_MAX_SEC", "15"))  # only clips up to this length batch
+STT_TIMEOUT         = float(os.getenv("STT_TIMEOUT", "120"))
+STT_LANGUAGE        = os.getenv("STT_LANGUAGE", "zh")
+STT_SR              = 16000
+
+
+class _Clip:
+    def __init__(self, audio: np.ndarray):
+        self.audio = audio
+        self.result = None
+        self.done = threading.Event()
+
+    @property
+    def seconds(self) -> float:
+        return len(self.audio) / STT_SR
+
+
+class STTPool:
+    """Replicas of a WhisperModel behind one queue; transcribe() is safe from any thread."""
+
+    def __init__(self, factory: Callable[[], object], *, replicas: int = STT_REPLICAS,
+                 max_queue: int = STT_QUEUE_MAX, window_ms: float = STT_BATCH_WINDOW_MS,
+                 max_batch: int = STT_BATCH_MAX):
+        self.replicas = max(1, replicas)
+        self.window = max(0.0, window_ms) / 1000.0
+        self.max_batch = max(1, max_batch)
+        self._q: "queue.Queue[_Clip]" = queue.Queue(maxsize=max(1, max_queue))
+        self._lock = threading.Lock()
+        self._batch_ok = self.max_batch > 1
+        self.clips = 0
+        self.batched_clips = 0
+        self.busy_sec = 0.0
+        models = [factory() for _ in range(self.replicas)]
+        for i, m in enumerate(models):
+            threading.Thread(target=self._loop, args=(m,), name=f"stt-worker-{i}", daemon=True).start()
+
+    @property
+    def depth(self) -> int:
+        return self._q.qsize()
+
+    def transcribe(self, audio: np.ndarray, timeout: Optional[float] = STT_TIMEOUT) -> str:
+        """16 kHz mono float32 -> text. Raises QueueFull / TimeoutError / the model's error."""
+        clip = _Clip(np.asarray(audio, dtype=np.float32))
+        try:
+            self._q.put_nowait(clip)
+        except queue.Full:
+            raise QueueFull(f"STT queue full ({self._q.maxsize})")
+        if not clip.done.wait(timeout):
+            raise TimeoutError(f"STT request timed out after {timeout:.0f}s")
+        if isinstance(clip.result, Exception):
+            raise clip.result
+        return clip.result
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"replicas": self.replicas, "depth": self.depth, "capacity": self._q.maxsize,
+                    "clips": self.clips, "batched_clips": self.batched_clips,
+                    "batching": self._batch_ok, "busy_sec": round(self.busy_sec, 2)}
+
+    def close(self):
+        """Stop the workers (and release their models) once the queue is drained."""
+        for _ in range(self.replicas):
+            self._q.put(None)
+
+    def _collect(self) -> Optional[List[_Clip]]:
+        first = self._q.get()
+        if first is None:
+            return None
+        batch = [first]
+        if not self._batch_ok or first.seconds > STT_BATCH_MAX_SEC:
+            return batch
+        deadline = time.perf_counter() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                clip = self._q.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if clip is None:   # close(): leave the stop marker for the next round
+                self._q.put(None)
+                break
+            batch.append(clip)   # long clips are split off in _loop
+        return batch
+
+    def _loop(self, model):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            t0 = time.perf_counter()
+            short = [c for c in batch if c.seconds <= STT_BATCH_MAX_SEC]
+            rest = [c for c in batch if c.seconds > STT_BATCH_MAX_SEC]
+            if self._batch_ok and len(short) > 1:
+                try:
+                    for clip, text in zip(short, _transcribe_batch(model, [c.audio for c in short])):
+                        clip.result = text
+                        clip.done.set()
+                    with self._lock:
+                        self.batched_clips += len(short)
+                except Exception as e:
+                    print(f"[WARN] STT batch path failed, falling back to per-clip: {e!r}")
+                    self._batch_ok = False
+                    rest = short + rest
+            else:
+                rest = short + rest
+            for clip in rest:
+                try:
+                    clip.result = _transcribe_one(model, clip.audio)
+                except Exception as e:
+                    clip.result = e
+                clip.done.set()
+            with self._lock:
+                self.clips += len(batch)
+                self.busy_sec += time.perf_counter() - t0
+
+
+def _transcribe_one(model, audio: np.ndarray) -> str:
+    segments, info = model.transcribe(audio, beam_size=1, language=STT_LANGUAGE)
+    return "".join([seg.text for seg in segments]).strip()
+
+
+def _transcribe_batch(model, audios: List[np.ndarray]) -> List[str]:
+    """Greedy decode of several <=30 s clips in one CTranslate2 call (no VAD / temperature fallback)."""
+    from faster_whisper.audio import pad_or_trim
+    from faster_whisper.tokenizer import Tokenizer
+
+    tokenizer = Tokenizer(model.hf_tokenizer, model.model.is_multilingual,
+                          task="transcribe", language=STT_LANGUAGE)
+    feats = np.stack([pad_or_trim(model.feature_extractor(a)) for a in audios])
+    encoder_output = model.encode(feats)
+    prompt = model.get_prompt(tokenizer, [], without_timestamps=True)
+    results = model.model.generate(encoder_output, [prompt] * len(audios), beam_size=1,
+                                   max_length=model.max_length, suppress_blank=True)
+    return [tokenizer.decode(r.sequences_ids[0]).strip() for r in results]
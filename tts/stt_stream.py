@@ -0,0 +1,126 @@
+# filename: stt_stream.py
+# Incremental STT for /stt/stream: 16 kHz mono float32 frames in, events out.
+# An energy VAD (rolling-minimum noise floor) cuts utterances; while one is open the audio so far is
+# re-transcribed every PARTIAL_EVERY_MS ("partial"), and once VAD_SILENCE_MS of silence follows
+# it is transcribed in full ("final"), so the caller can act as soon as the user stops talking.
+
+import os
+from collections import deque
+from typing import Callable, Iterator, List
+
+import numpy as np
+
+STT_SR           = 16000
+FRAME_MS         = 30
+VAD_MARGIN_DB    = float(os.getenv("STT_VAD_MARGIN_DB", "10"))    # speech: this far above noise floor
+VAD_MIN_DB       = float(os.getenv("STT_VAD_MIN_DB", "-50"))      # ... and above this absolute level
+VAD_FLOOR_MS     = int(os.getenv("STT_VAD_FLOOR_MS", "3000"))     # noise floor = quietest frame in this window
+VAD_SILENCE_MS   = int(os.getenv("STT_VAD_SILENCE_MS", "600"))    # silence that ends an utterance
+VAD_MIN_SPEECH_MS = int(os.getenv("STT_VAD_MIN_SPEECH_MS", "150"))
+VAD_PREROLL_MS   = int(os.getenv("STT_VAD_PREROLL_MS", "200"))    # audio kept before speech onset
+MAX_UTTER_SEC    = float(os.getenv("STT_MAX_UTTER_SEC", "20"))
+PARTIAL_EVERY_MS = int(os.getenv("STT_PARTIAL_EVERY_MS", "800"))  # 0 disables partials
+
+
+class StreamingTranscriber:
+    """Feed float32 samples at STT_SR; yields {"type": "start"|"partial"|"final", ...} events.
+
+    transcribe(audio) -> str is called synchronously for partials and finals.
+    """
+
+    def __init__(self, transcribe: Callable[[np.ndarray], str]):
+        self.transcribe = transcribe
+        self.frame = STT_SR * FRAME_MS // 1000
+        self._pending = np.zeros(0, dtype=np.float32)   # < one frame, carried to the next feed
+        self._preroll: List[np.ndarray] = []
+        self._utter: List[np.ndarray] = []
+        self._speech_frames = 0
+        self._silence_frames = 0
+        self._since_partial = 0
+        self._in_speech = False
+        self._pos = 0                 # samples consumed so far
+        self._start = 0
+        # Until the window has filled, a floor of VAD_MIN_DB - margin takes part, so a session that
+        # opens with speech (push-to-talk) is not mistaken for its own noise floor.
+        self._levels = deque(maxlen=max(1, VAD_FLOOR_MS // FRAME_MS))
+        self._seed_db = VAD_MIN_DB - VAD_MARGIN_DB
+        self._last_partial = ""
+
+    @property
+    def noise_db(self) -> float:
+        floor = min(self._levels) if self._levels else self._seed_db
+        return floor if len(self._levels) == self._levels.maxlen else min(floor, self._seed_db)
+
+    def _is_speech(self, frame: np.ndarray) -> bool:
+        db = 10.0 * np.log10(float(np.mean(frame * frame)) + 1e-10)
+        # speech has gaps between syllables, so the window minimum tracks the background even mid-utterance
+        self._levels.append(db)
+        return db > max(VAD_MIN_DB, self.noise_db + VAD_MARGIN_DB)
+
+    def feed(self, samples: np.ndarray) -> Iterator[dict]:
+        x = np.concatenate([self._pending, np.asarray(samples, dtype=np.float32)])
+        n = len(x) // self.frame * self.frame
+        self._pending = x[n:].copy()
+        for i in range(0, n, self.frame):
+            yield from self._on_frame(x[i:i + self.frame])
+
+    def _on_frame(self, frame: np.ndarray) -> Iterator[dict]:
+        speech = self._is_speech(frame)
+        self._pos += len(frame)
+        ms = lambda frames: frames * FRAME_MS
+        if not self._in_speech:
+            self._preroll.append(frame)
+            self._speech_frames = self._speech_frames + 1 if speech else 0
+            keep = (VAD_PREROLL_MS + VAD_MIN_SPEECH_MS) // FRAME_MS + 1
+            del self._preroll[:-keep]
+            if ms(self._speech_frames) >= VAD_MIN_SPEECH_MS:
+                yield self._open()
+            return
+
+        self._utter.append(frame)
+        self._silence_frames = 0 if speech else self._silence_frames + 1
+        self._since_partial += 1
+        if (ms(self._silence_frames) >= VAD_SILENCE_MS
+                or len(self._utter) * self.frame >= MAX_UTTER_SEC * STT_SR):
+            yield from self._final()
+        elif PARTIAL_EVERY_MS > 0 and ms(self._since_partial) >= PARTIAL_EVERY_MS:
+            self._since_partial = 0
+            text = self.transcribe(np.concatenate(self._utter))
+            if text and text != self._last_partial:
+                self._last_partial = text
+                yield {"type": "partial", "text": text, "start": round(self._start / STT_SR, 3)}
+
+    def _open(self) -> dict:
+        """Speech onset: the utterance starts VAD_PREROLL_MS before the first speech frame."""
+        self._in_speech = True
+        pre = VAD_PREROLL_MS // FRAME_MS + self._speech_frames
+        self._utter = self._preroll[-pre:]
+        self._preroll = []
+        self._start = self._pos - sum(len(f) for f in self._utter)
+        self._silence_frames = self._since_partial = 0
+        self._last_partial = ""
+        return {"type": "start", "start": round(self._start / STT_SR, 3)}
+
+    def _final(self) -> Iterator[dict]:
+        # trailing silence beyond the pre-roll length adds nothing to the transcript
+        tail = max(0, self._silence_frames - VAD_PREROLL_MS // FRAME_MS)
+        audio = np.concatenate(self._utter[:len(self._utter) - tail] if tail else self._utter)
+        self._in_speech = False
+        self._utter, self._speech_frames, self._silence_frames = [], 0, 0
+        text = self.transcribe(audio)
+        yield {"type": "final", "text": text,
+               "start": round(self._start / STT_SR, 3), "end": round(self._pos / STT_SR, 3)}
+
+    def flush(self) -> Iterator[dict]:
+        """End of input: finalize buffered speech (pending sub-frame audio included).
+
+        That is an open utterance, or an onset still shorter than VAD_MIN_SPEECH_MS.
+        """
+        if not self._in_speech and self._speech_frames > 0:
+            yield self._open()
+        if self._in_speech:
+            if len(self._pending):
+                self._utter.append(self._pending)
+                self._pos += len(self._pending)
+            self._pending = np.zeros(0, dtype=np.float32)
+            yield from self._final()
@@ -0,0 +1,76 @@
+# filename: test_stt_stream.py
+# StreamingTranscriber VAD on synthetic audio (numpy only):  python -m pytest -q test_stt_stream.py
+
+import numpy as np
+
+import stt_stream
+from stt_stream import StreamingTranscriber, STT_SR
+
+_rng = np.random.default_rng(0)
+
+
+def _noise(sec: float, db: float = -65.0) -> np.ndarray:
+    return (_rng.standard_normal(int(sec * STT_SR)) * 10 ** (db / 20)).astype(np.float32)
+
+
+def _speech(sec: float, db: float = -20.0) -> np.ndarray:
+    """Voiced tone in 200 ms syllables with 50 ms dips between them, over background."""
+    t = np.arange(int(sec * STT_SR)) / STT_SR
+    env = np.where((t * 4) % 1.0 < 0.8, 1.0, 0.05)
+    voiced = np.sin(2 * np.pi * 180 * t) * env * 10 ** (db / 20) * np.sqrt(2)
+    return (voiced + _noise(sec)).astype(np.float32)
+
+
+def _run(audio: np.ndarray, chunk_ms: int = 100):
+    heard = []
+    vad = StreamingTranscriber(lambda a: heard.append(len(a) / STT_SR) or "text")
+    step = STT_SR * chunk_ms // 1000
+    events = [ev for i in range(0, len(audio), step) for ev in vad.feed(audio[i:i + step])]
+    return events, list(vad.flush()), heard
+
+
+def _types(events):
+    return [e["type"] for e in events if e["type"] != "partial"]
+
+
+def test_session_starting_with_speech_is_transcribed():
+    events, flushed, heard = _run(np.concatenate([_speech(2.0), _noise(1.0)]))
+    assert _types(events) == ["start", "final"]
+    assert flushed == []
+    assert events[0]["start"] == 0.0
+    assert 1.9 <= heard[-1] <= 2.0 + stt_stream.VAD_PREROLL_MS / 1000 + 0.05   # final pass
+
+
+def test_quiet_lead_in_then_speech():
+    events, flushed, _ = _run(np.concatenate([_noise(1.0), _speech(1.5), _noise(1.0)]))
+    assert _types(events) == ["start", "final"]
+    assert 0.7 <= events[0]["start"] <= 1.0
+
+
+def test_flush_finalizes_open_utterance():
+    events, flushed, heard = _run(np.concatenate([_noise(0.5), _speech(1.0)]))
+    assert _types(events) == ["start"]
+    assert _types(flushed) == ["final"]
+    assert heard[-1] >= 1.0
+
+
+def test_flush_finalizes_onset_shorter_than_min_speech():
+    short = stt_stream.VAD_MIN_SPEECH_MS / 2000
+    events, flushed, heard = _run(np.concatenate([_noise(0.5), _speech(short, db=-15.0)]), chunk_ms=30)
+    assert _types(events) == []
+    assert _types(flushed) == ["start", "final"]
+    assert len(heard) == 1
+
+
+def test_noise_floor_follows_loud_background():
+    # steady background above VAD_MIN_DB: until the floor window fills it may open an utterance,
+    # after that only real speech does
+    floor_sec = stt_stream.VAD_FLOOR_MS / 1000
+    onset = floor_sec + 2.0
+    events, flushed, _ = _run(np.concatenate([_noise(onset, db=-40.0),
+                                              _speech(1.5, db=-15.0) + _noise(1.5, db=-40.0),
+                                              _noise(1.5, db=-40.0)]))
+    starts = [e["start"] for e in events if e["type"] == "start"]
+    assert [s for s in starts if s > floor_sec] == [s for s in starts if abs(s - onset) < 0.3]
+    assert len([s for s in starts if abs(s - onset) < 0.3]) == 1
+    assert flushed == []
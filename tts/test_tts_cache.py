@@ -0,0 +1,82 @@
+# filename: test_tts_cache.py
+# SegmentCache byte budget, LRU order and keys (numpy only):  python -m pytest -q test_tts_cache.py
+
+import os
+
+import numpy as np
+
+import tts_cache
+from tts_cache import SegmentCache
+
+N = 1000   # samples per entry
+
+
+def _wave(v: float) -> np.ndarray:
+    return np.full(N, v, dtype=np.float32)
+
+
+def _cache(tmp_path, entries: float) -> SegmentCache:
+    """Cache whose budget holds `entries` waves of N samples."""
+    probe = SegmentCache(tmp_path / "probe", max_mb=1)
+    probe.put("x", _wave(0))
+    size = (tmp_path / "probe" / "x.npy").stat().st_size
+    return SegmentCache(tmp_path / "c", max_mb=entries * size / 1024 / 1024)
+
+
+def _keys(c: SegmentCache) -> list:
+    return sorted(p.stem for p in c.root.glob("*.npy"))
+
+
+def test_evicts_oldest_over_byte_budget(tmp_path):
+    c = _cache(tmp_path, 3.5)
+    for i, k in enumerate("abcd"):
+        c.put(k, _wave(i))
+    assert _keys(c) == ["b", "c", "d"]
+    assert c.get("a") is None
+    assert c.get("d")[0] == 3
+    s = c.stats()
+    assert s["entries"] == 3 and s["hits"] == 1 and s["misses"] == 1
+    assert not list(c.root.glob("*.tmp"))
+
+
+def test_get_touches_entry(tmp_path):
+    c = _cache(tmp_path, 3.5)
+    for k in "abc":
+        c.put(k, _wave(0))
+    assert c.get("a") is not None      # a is now most recent: b goes first
+    c.put("d", _wave(0))
+    assert _keys(c) == ["a", "c", "d"]
+    c.put("c", _wave(1))                # overwrite also refreshes and keeps the byte count
+    c.put("e", _wave(0))
+    assert _keys(c) == ["c", "d", "e"]
+    assert c.stats()["entries"] == 3
+
+
+def test_index_rebuilt_from_mtimes_and_trimmed(tmp_path):
+    c = _cache(tmp_path, 10)
+    for i, k in enumerate("abcd"):
+        c.put(k, _wave(i))
+        os.utime(c._path(k), (1000 + i, 1000 + i))
+    os.utime(c._path("a"), (2000, 2000))  # a read last
+    again = SegmentCache(c.root, max_mb=c.max_bytes * 0.25 / 1024 / 1024)
+    assert _keys(again) == ["a", "d"]
+    assert again.get("d")[0] == 3
+
+
+def test_disabled_cache_is_a_no_op(tmp_path):
+    c = SegmentCache(tmp_path / "off", max_mb=0)
+    c.put("a", _wave(0))
+    assert c.get("a") is None
+    assert not (tmp_path / "off").exists()
+
+
+def test_make_key_seed_policy(monkeypatch):
+    key = lambda seed, **kw: SegmentCache.make_key("voice", "你好。", **{**dict(
+        speed=0.9, nfe_step=16, cross_fade_sec=0.12, seed=seed), **kw})
+    assert key(7) == key(7) != key(8)
+    assert key(None) not in (key(7), None)
+    assert key(7, speed=0.90001) == key(7) != key(7, speed=1.0)
+    assert key(7, nfe_step=32) != key(7)
+    monkeypatch.setattr(tts_cache, "CACHE_RANDOM_SEED", False)
+    assert key(None) is None
+    assert key(7) is not None
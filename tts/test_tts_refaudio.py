@@ -0,0 +1,88 @@
+# filename: test_tts_refaudio.py
+# voice_span / edge_span vs the pydub reference path they replace:  python -m pytest -q test_tts_refaudio.py
+# (pydub comes with f5_tts; skipped without it)
+
+import warnings
+
+import numpy as np
+import pytest
+
+with warnings.catch_warnings():
+    warnings.simplefilter("ignore")   # pydub warns when ffmpeg is missing; raw PCM doesn't need it
+    pydub = pytest.importorskip("pydub")
+from pydub.silence import detect_nonsilent, detect_leading_silence
+
+import tts_refaudio as ra
+
+SR = 24000
+
+
+def _clip(rng, parts) -> np.ndarray:
+    """parts: (sec, dBFS) runs of noise; int16-exact so both paths see the same samples."""
+    x = np.concatenate([rng.standard_normal(int(sec * SR)) * 10 ** (db / 20) for sec, db in parts])
+    return np.round(np.clip(x, -1, 1) * 32767).astype(np.int16)
+
+
+def _segment(pcm: np.ndarray):
+    return pydub.AudioSegment(pcm.tobytes(), sample_width=2, frame_rate=SR, channels=1)
+
+
+def _float(pcm: np.ndarray) -> np.ndarray:
+    return pcm.astype(np.float32) / 32768.0
+
+
+def _pydub_voice_ms(seg) -> tuple:
+    """Old TTSManager._trim_reference head/tail cut, in ms."""
+    nonsil = detect_nonsilent(seg, min_silence_len=ra.SIL_MIN_MS, silence_thresh=seg.dBFS + ra.SIL_THRESH_REL)
+    if not nonsil:
+        return 0, len(seg)
+    return max(0, nonsil[0][0] - ra.SIL_BACKOFF_MS), min(len(seg), nonsil[-1][1] + ra.SIL_BACKOFF_MS)
+
+
+def _f5_edges_ms(seg, silence_threshold=ra.REF_EDGE_DB) -> tuple:
+    """f5_tts utils_infer.remove_silence_edges, returning the kept (start, end) in ms."""
+    start = detect_leading_silence(seg, silence_threshold=silence_threshold)
+    seg = seg[start:]
+    end = seg.duration_seconds
+    for ms in reversed(seg):
+        if ms.dBFS > silence_threshold:
+            break
+        end -= 0.001
+    return start, start + int(end * 1000)
+
+
+def _cases():
+    rng = np.random.default_rng(0)
+    yield "speech only", _clip(rng, [(1.0, -20)])
+    yield "lead and tail", _clip(rng, [(0.4, -70), (1.2, -20), (0.6, -70)])
+    yield "inner pause", _clip(rng, [(0.3, -70), (0.5, -18), (0.4, -70), (0.7, -22), (0.5, -70)])
+    yield "short dip kept", _clip(rng, [(0.2, -70), (0.5, -20), (0.05, -70), (0.5, -20), (0.3, -65)])
+    yield "all quiet", _clip(rng, [(0.8, -70)])
+    for i in range(12):
+        parts = [(float(rng.uniform(0.05, 0.6)), float(rng.choice([-75, -60, -45, -30, -15])))
+                 for _ in range(rng.integers(1, 7))]
+        yield f"random {i}", _clip(rng, parts)
+
+
+CASES = list(_cases())
+
+
+@pytest.mark.parametrize("name,pcm", CASES, ids=[c[0] for c in CASES])
+def test_voice_span_matches_detect_nonsilent(name, pcm):
+    start, end = ra.voice_span(_float(pcm), SR)
+    want = _pydub_voice_ms(_segment(pcm))
+    per_ms = SR // 1000
+    assert abs(start - want[0] * per_ms) <= per_ms and abs(end - want[1] * per_ms) <= per_ms, (start, end, want)
+
+
+@pytest.mark.parametrize("name,pcm", CASES, ids=[c[0] for c in CASES])
+def test_edge_span_matches_remove_silence_edges(name, pcm):
+    start, end = ra.edge_span(_float(pcm), SR)
+    want = _f5_edges_ms(_segment(pcm))
+    per_ms = SR // 1000
+    if want[0] == want[1]:          # all below the threshold: nothing kept either way
+        assert start == end
+        return
+    assert start == want[0] * per_ms
+    # pydub rounds the clip to whole ms (padding up to 2 ms of silence), so f5's end can be 1 ms later
+    assert abs(end - want[1] * per_ms) <= per_ms, (start, end, want)
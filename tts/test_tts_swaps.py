@@ -0,0 +1,53 @@
+# filename: test_tts_swaps.py
+# Compiled SwapTable vs rule-by-rule apply_swaps (pure Python):  python -m pytest -q test_tts_swaps.py
+
+import random
+from pathlib import Path
+
+import pytest
+
+from tts_swaps import SwapRule, SwapTable, load_swaps, apply_swaps
+
+SWAPS_TXT = Path(__file__).parent / "swaps.txt"
+
+
+def _fragments(rules) -> list:
+    """Pieces that make rules fire (and chain/overlap): literal patterns and all replacements."""
+    out = [r.pattern for r in rules if not r.is_regex] + [r.replacement for r in rules]
+    return [f for f in out if f and "\\" not in f]
+
+
+def _texts(pieces, n: int, seed: int) -> list:
+    rng = random.Random(seed)
+    filler = [chr(c) for c in range(0x4E00, 0x4E00 + 200)] + list("，。！？ ab12")
+    return ["".join(rng.choice(pieces) if rng.random() < 0.6 else rng.choice(filler)
+                    for _ in range(rng.randint(1, 40))) for _ in range(n)]
+
+
+def test_swaps_txt_compiled_matches_sequential():
+    table = load_swaps(SWAPS_TXT)
+    assert len(table) > 0
+    for t in _texts(_fragments(table.rules), 2000, seed=0):
+        assert table.apply(t) == apply_swaps(t, table.rules), t
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_random_literal_rules_compiled_matches_sequential(seed):
+    # tiny alphabet so patterns overlap, contain each other and feed later rules
+    rng = random.Random(seed)
+    word = lambda: "".join(rng.choice("abcd") for _ in range(rng.randint(1, 3)))
+    rules = [SwapRule(p, word(), False) for p in (word() for _ in range(rng.randint(1, 12)))]
+    if seed % 4 == 0:
+        rules.insert(rng.randrange(len(rules) + 1), SwapRule("a+", "d", True))
+    table = SwapTable(rules)
+    for t in _texts(list("abcd") + ["ab", "cd", "abc"], 300, seed=seed):
+        assert table.apply(t) == apply_swaps(t, rules), (t, [(r.pattern, r.replacement) for r in rules])
+
+
+def test_load_swaps_parses_file(tmp_path):
+    p = tmp_path / "swaps.txt"
+    p.write_text("# comment\n甲 => 乙   # trailing\nre:\\d+ => 數\n空 =>\nno arrow\n", encoding="utf-8")
+    table = load_swaps(p)
+    assert [(r.pattern, r.replacement, r.is_regex) for r in table.rules] == [("甲", "乙", False), ("\\d+", "數", True)]
+    assert table.apply("甲12") == "乙數"
+    assert len(load_swaps(tmp_path / "missing.txt")) == 0
@@ -0,0 +1,127 @@
+# filename: tts_cache.py
+# Disk-backed LRU of synthesized segment audio. One float32 .npy per segment, keyed by
+# (model, voice audio hash + ref_text, processed segment text, speed, nfe_step, cross-fade, seed policy).
+# Whole replies are cached too, since a short reply is a single segment.
+
+import os, json, hashlib, threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+CACHE_DIR      = Path(os.getenv("F5TTS_CACHE_DIR", str(Path(__file__).parent / "_tts_cache")))
+CACHE_MAX_MB   = float(os.getenv("F5TTS_CACHE_MB", "256"))    # 0 disables the cache
+# Requests without an explicit seed draw a random one; "true" lets them reuse audio cached
+# under any random seed (stock phrases come back instantly), "false" never caches them.
+CACHE_RANDOM_SEED = os.getenv("F5TTS_CACHE_RANDOM_SEED", "true").lower() == "true"
+
+
+class SegmentCache:
+    """LRU by access time over CACHE_DIR; the index is rebuilt from file mtimes on start."""
+
+    def __init__(self, root: Path = CACHE_DIR, max_mb: float = CACHE_MAX_MB):
+        self.root = Path(root)
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._index: "OrderedDict[str, int]" = OrderedDict()   # key -> file size, oldest first
+        self._bytes = 0
+        if self.enabled:
+            self.root.mkdir(parents=True, exist_ok=True)
+            entries = []
+            for p in self.root.glob("*.npy"):
+                try:
+                    st = p.stat()
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, p.stem, st.st_size))
+            for _, key, size in sorted(entries):
+                self._index[key] = size
+                self._bytes += size
+            self._evict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    @staticmethod
+    def make_key(voice_tag: str, text: str, *, speed: float, nfe_step: int,
+                 cross_fade_sec: float, seed: Optional[int]) -> Optional[str]:
+        """Cache key, or None when this request must not be cached (random seed, policy off)."""
+        if seed is None and not CACHE_RANDOM_SEED:
+            return None
+        blob = json.dumps([voice_tag, text, round(speed, 4), nfe_step, round(cross_fade_sec, 4),
+                           "any" if seed is None else seed], ensure_ascii=False)
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.root / f"{key}.npy"
+
+    def get(self, key: Optional[str]) -> Optional[np.ndarray]:
+        if not self.enabled or key is None:
+            return None
+        with self._lock:
+            known = key in self._index
+            if known:
+                self._index.move_to_end(key)
+        if known:
+            p = self._path(key)
+            try:
+                wave = np.load(p, allow_pickle=False)
+                os.utime(p)
+                with self._lock:
+                    self.hits += 1
+                return wave
+            except (OSError, ValueError):
+                with self._lock:
+                    self._bytes -= self._index.pop(key, 0)
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: Optional[str], wave: np.ndarray):
+        if not self.enabled or key is None:
+            return
+        p = self._path(key)
+        tmp = p.with_name(f".{p.stem}.{threading.get_ident()}.tmp")
+        try:
+            with open(tmp, "wb") as f:
+                np.save(f, np.asarray(wave, dtype=np.float32), allow_pickle=False)
+            os.replace(tmp, p)
+            size = p.stat().st_size
+        except OSError as e:
+            print(f"[WARN] tts cache write failed: {e}")
+            try:
+                tmp.unlink()
+            except OSError:
+                pass
+            return
+        with self._lock:
+            self._bytes += size - self._index.pop(key, 0)
+            self._index[key] = size
+            self._evict()
+
+    def _evict(self):
+        # caller holds the lock (or is __init__)
+        while self._bytes > self.max_bytes and self._index:
+            key, size = self._index.popitem(last=False)
+            self._bytes -= size
+            try:
+                self._path(key).unlink()
+            except OSError:
+                pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._index),
+                "mb": round(self._bytes / 1024 / 1024, 2),
+                "max_mb": round(self.max_bytes / 1024 / 1024, 2),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            }
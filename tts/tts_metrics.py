@@ -0,0 +1,166 @@
+# filename: tts_metrics.py
+# Process-wide performance metrics for GET /metrics, in Prometheus text format (no client library).
+# Histograms/counters are updated in place by the code being measured; gauges and totals kept
+# elsewhere (queue depth, cache stats) are set by the server right before rendering a scrape.
+# Work done inside suppressed() (warmup passes) is not recorded on that thread.
+
+import math, threading, time
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+RTF_BUCKETS     = (0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.0, 5.0)
+
+_registry: List["_Metric"] = []
+_lock = threading.Lock()
+_local = threading.local()
+
+
+@contextmanager
+def suppressed():
+    """Skip recording on this thread (synthetic work, e.g. warmup) for the duration."""
+    prev = getattr(_local, "off", False)
+    _local.off = True
+    try:
+        yield
+    finally:
+        _local.off = prev
+
+
+def _off() -> bool:
+    return getattr(_local, "off", False)
+
+
+def _fmt(v: float) -> str:
+    if math.isinf(v):
+        return "+Inf" if v > 0 else "-Inf"
+    return repr(float(v)) if v != int(v) else str(int(v))
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{k}="{v}"' for k, v in zip(names, values)] + ([extra] if extra else [])
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name, self.help, self.labelnames = name, help, tuple(labels)
+        self._values: Dict[Tuple[str, ...], object] = {}
+        with _lock:
+            _registry.append(self)
+
+    def _key(self, labels: dict) -> Tuple[str, ...]:
+        return tuple(str(labels.get(k, "")) for k in self.labelnames)
+
+    def _lines(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        with _lock:
+            body = self._lines()
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"] + body
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        super().__init__(name, help, labels)
+        if not self.labelnames:
+            self._values[()] = 0.0
+
+    def inc(self, v: float = 1.0, **labels):
+        if _off():
+            return
+        k = self._key(labels)
+        with _lock:
+            self._values[k] = self._values.get(k, 0.0) + v
+
+    def set(self, v: float, **labels):
+        """For running totals kept by another object (e.g. SegmentCache.hits)."""
+        with _lock:
+            self._values[self._key(labels)] = float(v)
+
+    def _lines(self) -> List[str]:
+        return [f"{self.name}{_labels(self.labelnames, k)} {_fmt(v)}" for k, v in self._values.items()]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        if not self.labelnames:
+            self._values[()] = ([0] * len(self.buckets), 0.0)
+
+    def observe(self, v: float, **labels):
+        if _off():
+            return
+        k = self._key(labels)
+        with _lock:
+            counts, total = self._values.get(k) or ([0] * len(self.buckets), 0.0)
+            for i, le in enumerate(self.buckets):
+                if v <= le:
+                    counts[i] += 1
+                    break
+            self._values[k] = (counts, total + v)
+
+    @contextmanager
+    def time(self, **labels):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, **labels)
+
+    def _lines(self) -> List[str]:
+        out = []
+        for k, (counts, total) in self._values.items():
+            acc = 0
+            for le, c in zip(self.buckets, counts):
+                acc += c
+                le_label = 'le="%s"' % _fmt(le)
+                out.append(f"{self.name}_bucket{_labels(self.labelnames, k, le_label)} {acc}")
+            out.append(f"{self.name}_sum{_labels(self.labelnames, k)} {_fmt(total)}")
+            out.append(f"{self.name}_count{_labels(self.labelnames, k)} {acc}")
+        return out
+
+
+def render() -> str:
+    with _lock:
+        metrics = list(_registry)
+    return "\n".join(line for m in metrics for line in m.render()) + "\n"
+
+
+# ===== TTS =====
+TEXT_SEC      = Histogram("tts_text_seconds", "Text front-end (directives, normalize, swaps, segment) per request")
+INFER_SEC     = Histogram("tts_inference_seconds", "DiT sampling (model.sample) per batch", ("nfe",))
+VOCODER_SEC   = Histogram("tts_vocoder_seconds", "Vocoder decode per batch")
+POST_SEC      = Histogram("tts_post_seconds", "Join, pauses, trim and fades per request")
+WRITE_SEC     = Histogram("tts_write_seconds", "Output wav write (atomic rename) per request")
+RTF           = Histogram("tts_rtf", "Compute seconds per audio second, per scheduled request", ("quality",),
+                          buckets=RTF_BUCKETS)
+SEGMENTS      = Counter("tts_segments_total", "Text segments synthesized", ("source",))   # model | cache
+BATCH_ITEMS   = Counter("tts_batch_items_total", "Chunks passed through model.sample")
+AUDIO_SEC     = Counter("tts_audio_seconds_total", "Audio seconds produced")
+QUEUE_DEPTH   = Gauge("tts_queue_depth", "Requests waiting for the inference worker")
+QUEUE_CAP     = Gauge("tts_queue_capacity", "Inference queue capacity")
+CACHE_HITS    = Counter("tts_cache_hits_total", "Lookups answered from a cache", ("cache",))   # segment | text
+CACHE_MISSES  = Counter("tts_cache_misses_total", "Lookups not in a cache", ("cache",))
+CACHE_RATIO   = Gauge("tts_cache_hit_ratio", "Hits / lookups since start", ("cache",))
+WARMUP_SEC    = Histogram("tts_warmup_seconds", "Warmup passes (kept out of the stage metrics above)")
+WARM_SHAPES   = Gauge("tts_warm_shapes", "Input-shape buckets that have run through the model")
+
+# ===== STT =====
+STT_DECODE_SEC     = Histogram("stt_decode_seconds", "Upload decode + resample to 16 kHz mono per request")
+STT_TRANSCRIBE_SEC = Histogram("stt_transcribe_seconds", "Transcription per clip (queue wait included)", ("endpoint",))
+STT_AUDIO_SEC      = Counter("stt_audio_seconds_total", "Audio seconds transcribed", ("endpoint",))
+STT_QUEUE_DEPTH    = Gauge("stt_queue_depth", "Clips waiting for an STT replica")
+STT_QUEUE_CAP      = Gauge("stt_queue_capacity", "STT queue capacity")
@@ -0,0 +1,56 @@
+# filename: tts_refaudio.py
+# Reference-audio trimming on float32 mono arrays (numpy only), in place of the old pydub path:
+# voice_span ~ pydub detect_nonsilent head/tail trim, edge_span ~ f5_tts remove_silence_edges.
+
+import os
+
+import numpy as np
+
+# Head/tail silence trim of the uploaded reference (pydub detect_nonsilent settings)
+SIL_MIN_MS     = int(os.getenv("F5TTS_SIL_MIN_MS", "120"))
+SIL_THRESH_REL = float(os.getenv("F5TTS_SIL_THRESH_DB", "-30"))
+SIL_BACKOFF_MS = int(os.getenv("F5TTS_SIL_BACKOFF_MS", "20"))
+# f5_tts preprocess_ref_audio_text (remove_silence_edges) steps, applied after the trim, tail pad and fades
+REF_EDGE_DB      = -42.0
+REF_EDGE_PAD_MS  = 50
+
+
+def frame_power(x: np.ndarray, n: int) -> np.ndarray:
+    """Mean square per n-sample frame (last frame may be short)."""
+    if len(x) == 0:
+        return np.zeros(0)
+    idx = np.arange(0, len(x), n)
+    return np.add.reduceat(np.square(x, dtype=np.float64), idx) / np.diff(np.append(idx, len(x)))
+
+def voice_span(x: np.ndarray, sr: int) -> tuple:
+    """(start, end) samples from the first to the last non-silent span, as pydub detect_nonsilent.
+
+    SIL_MIN_MS windows in 1 ms steps are silent when their RMS is SIL_THRESH_REL dB or more below
+    the clip's RMS; silent windows closer than SIL_MIN_MS merge into one range.
+    """
+    per_ms, win = sr // 1000, SIL_MIN_MS
+    n_ms = len(x) // per_ms
+    if win <= 0 or n_ms < win:
+        return 0, len(x)
+    c = np.concatenate(([0.0], np.cumsum(frame_power(x[:n_ms * per_ms], per_ms))))
+    windows = (c[win:] - c[:-win]) / win
+    starts = np.flatnonzero(windows <= np.mean(np.square(x, dtype=np.float64)) * 10 ** (SIL_THRESH_REL / 10))
+    if len(starts) == 0:
+        return 0, len(x)
+    breaks = np.flatnonzero(np.diff(starts) > win)
+    first_end = starts[breaks[0] if len(breaks) else -1] + win
+    last_start = starts[breaks[-1] + 1 if len(breaks) else 0]
+    head = first_end if starts[0] == 0 else 0
+    tail = last_start if starts[-1] + win >= n_ms else n_ms
+    if head >= tail:   # all silent: leave as is
+        return 0, len(x)
+    return max(0, head - SIL_BACKOFF_MS) * per_ms, min(len(x), (tail + SIL_BACKOFF_MS) * per_ms)
+
+def edge_span(x: np.ndarray, sr: int) -> tuple:
+    """(start, end) samples after f5_tts remove_silence_edges: 10 ms head chunks, 1 ms tail steps."""
+    per_ms, thresh = sr // 1000, 10 ** (REF_EDGE_DB / 10)
+    loud = np.flatnonzero(frame_power(x, 10 * per_ms) >= thresh)
+    start = min(len(x), loud[0] * 10 * per_ms) if len(loud) else len(x)
+    # whole ms only: f5 walks the tail in 1 ms slices and truncates to whole ms
+    loud = np.flatnonzero(frame_power(x[start:start + (len(x) - start) // per_ms * per_ms], per_ms) > thresh)
+    return start, (start + (loud[-1] + 1) * per_ms if len(loud) else start)
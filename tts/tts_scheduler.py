@@ -0,0 +1,293 @@
+# filename: tts_scheduler.py
+# Single inference worker fed by a bounded queue; concurrent /tts requests arriving within a
+# short window are coalesced into one TTSManager.synthesize_batch call (micro-batch).
+# Also resolves the per-request quality tier ("fast"/"balanced"/"hq"/"adaptive") to nfe_step and
+# learns the compute cost per audio second per step, which drives "adaptive" and the RTF stats.
+
+import os, time, queue, threading
+from typing import Optional
+
+import numpy as np
+import soundfile as sf
+
+from TTS_Manager import NFE_TIERS
+from queue_errors import QueueFull
+import tts_metrics as metrics
+
+QUEUE_MAX       = int(os.getenv("TTS_QUEUE_MAX", "16"))
+BATCH_WINDOW_MS = float(os.getenv("TTS_BATCH_WINDOW_MS", "15"))
+MICROBATCH_MAX  = int(os.getenv("TTS_MICROBATCH_MAX", "8"))
+REQUEST_TIMEOUT = float(os.getenv("TTS_REQUEST_TIMEOUT", "180"))
+# "adaptive": highest tier up to "balanced" whose predicted time to finish (queued work + own)
+# stays within TARGET_RTF x own audio length and, if set, own compute within MAX_COMPUTE_SEC.
+# The RTF test is length-independent (own work scales with own audio), so only load lowers the
+# tier; long texts get fewer steps only when TTS_MAX_COMPUTE_SEC > 0 (off by default).
+TARGET_RTF      = float(os.getenv("TTS_TARGET_RTF", "0.5"))
+MAX_COMPUTE_SEC = float(os.getenv("TTS_MAX_COMPUTE_SEC", "0"))
+SEC_PER_CHAR    = float(os.getenv("TTS_SEC_PER_CHAR", "0.25"))   # initial audio-length estimate
+EWMA_ALPHA      = 0.2
+
+
+def _ewma(old: Optional[float], new: float) -> float:
+    return new if old is None else old + EWMA_ALPHA * (new - old)
+
+
+class _Job:
+    def __init__(self, request: dict, quality: str, est_audio: float):
+        self.request = request
+        self.quality = quality
+        self.est_audio = est_audio
+        self.t_enqueue = time.perf_counter()
+        self.t_start = 0.0
+        self.t_first = 0.0          # streams: first chunk ready
+        self.t_end = 0.0
+        self.batch_size = 0
+        self.audio_sec = 0.0
+        self.compute_share = 0.0   # this job's part of the batch compute time (by audio x steps)
+        self.result = None
+        self.done = threading.Event()
+        self.cancelled = False      # caller timed out: skip if still queued, drop its output file
+
+    @property
+    def work(self) -> float:
+        return self.est_audio * self.request["nfe_step"]
+
+    def timing(self) -> dict:
+        t = {
+            "queue_wait_ms": round((self.t_start - self.t_enqueue) * 1000, 1),
+            "compute_ms": round((self.t_end - self.t_start) * 1000, 1),
+            "batch_size": self.batch_size,
+            "quality": self.quality,
+            "nfe_step": self.request["nfe_step"],
+        }
+        if self.t_first:
+            t["first_chunk_ms"] = round((self.t_first - self.t_start) * 1000, 1)
+        if self.audio_sec > 0:
+            t["audio_sec"] = round(self.audio_sec, 3)
+            t["rtf"] = round(self.compute_share / self.audio_sec, 3)
+            t["rtf_e2e"] = round((self.t_end - self.t_enqueue) / self.audio_sec, 3)
+        return t
+
+
+class TTSScheduler:
+    """Owns all synthesize calls of the server: one worker thread, bounded FIFO, micro-batching."""
+
+    def __init__(self, tts, *, max_queue: int = QUEUE_MAX, window_ms: float = BATCH_WINDOW_MS,
+                 max_batch: int = MICROBATCH_MAX):
+        self.tts = tts
+        self.window = max(0.0, window_ms) / 1000.0
+        self.max_batch = max(1, max_batch)
+        self._q: "queue.Queue[_Job]" = queue.Queue(maxsize=max(1, max_queue))
+        self._lock = threading.Lock()
+        self._pending_work = 0.0             # sum of est audio sec x nfe over queued/running jobs
+        self._step_cost: Optional[float] = None   # compute sec per (audio sec x nfe step)
+        self._sec_per_char = SEC_PER_CHAR
+        self._tier_rtf: dict = {}
+        self._streams = 0                    # open /tts/stream requests (share the queue capacity)
+        self._worker = threading.Thread(target=self._loop, name="tts-worker", daemon=True)
+        self._worker.start()
+
+    @property
+    def depth(self) -> int:
+        return self._q.qsize()
+
+    @property
+    def capacity(self) -> int:
+        return self._q.maxsize
+
+    def estimate_audio(self, text: str) -> float:
+        return max(0.5, len(text or "") * self._sec_per_char)
+
+    def resolve_quality(self, request: dict) -> str:
+        """Set request["nfe_step"] from request["quality"] (popped); returns the tier used ("" = as given).
+
+        "adaptive" sizes the request from request["text"], so pass the text in. ValueError for a
+        quality that is neither a tier nor "adaptive".
+        """
+        q = str(request.pop("quality", "") or "").lower()
+        if q in NFE_TIERS:
+            request["nfe_step"] = NFE_TIERS[q]
+            return q
+        if not q:
+            return ""
+        if q != "adaptive":
+            raise ValueError(f"unknown quality: {q!r} (use {', '.join(NFE_TIERS)} or adaptive)")
+        est = self.estimate_audio(request.get("text", ""))
+        with self._lock:
+            cost, ahead = self._step_cost, self._pending_work
+        # candidates from "balanced" down, most steps first
+        tiers = sorted(((n, s) for n, s in NFE_TIERS.items() if s <= NFE_TIERS["balanced"]),
+                       key=lambda x: -x[1])
+        pick = tiers[0] if cost is None else tiers[-1]   # no measurements yet: balanced
+        if cost is not None:
+            for name, steps in tiers:
+                own = est * steps * cost
+                if (ahead * cost + own <= TARGET_RTF * est
+                        and (MAX_COMPUTE_SEC <= 0 or own <= MAX_COMPUTE_SEC)):
+                    pick = (name, steps)
+                    break
+        request["nfe_step"] = pick[1]
+        return f"adaptive:{pick[0]}"
+
+    def submit(self, request: dict) -> _Job:
+        request = dict(request)
+        quality = self.resolve_quality(request)
+        request.setdefault("nfe_step", NFE_TIERS["balanced"])
+        job = _Job(request, quality, self.estimate_audio(request.get("text", "")))
+        with self._lock:
+            streams = self._streams
+        if self.depth + streams >= self.capacity:
+            raise QueueFull(f"TTS queue full ({self.depth} queued + {streams} streams)")
+        try:
+            self._q.put_nowait(job)
+        except queue.Full:
+            raise QueueFull(f"TTS queue full ({self._q.maxsize})")
+        with self._lock:
+            self._pending_work += job.work
+        return job
+
+    def open_stream(self, request: dict) -> _Job:
+        """Admit a /tts/stream request against the queue capacity (QueueFull when over).
+
+        Resolves "quality" like submit() (job.request["nfe_step"] is the step count to use) and
+        counts the stream's estimated work as pending until close_stream(), so streams push
+        "adaptive" down for everyone. Streams run synthesize_stream on their own request thread;
+        the job only carries admission and timing (compute includes waiting for the model).
+        """
+        request = dict(request)
+        quality = self.resolve_quality(request)
+        request.setdefault("nfe_step", NFE_TIERS["balanced"])
+        job = _Job(request, quality, self.estimate_audio(request.get("text", "")))
+        with self._lock:
+            if self.depth + self._streams >= self.capacity:
+                raise QueueFull(f"TTS queue full ({self.depth} queued + {self._streams} streams)")
+            self._streams += 1
+            self._pending_work += job.work
+        job.t_start = job.t_enqueue
+        job.batch_size = 1
+        return job
+
+    def close_stream(self, job: _Job, audio_sec: float) -> dict:
+        """Release a stream's slot; returns its timing."""
+        job.t_end = time.perf_counter()
+        job.audio_sec = audio_sec
+        job.compute_share = job.t_end - job.t_start
+        with self._lock:
+            self._streams = max(0, self._streams - 1)
+            self._pending_work = max(0.0, self._pending_work - job.work)
+        return job.timing()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "depth": self.depth,
+                "streams": self._streams,
+                "capacity": self.capacity,
+                "target_rtf": TARGET_RTF,
+                "step_cost": None if self._step_cost is None else round(self._step_cost, 5),
+                "sec_per_char": round(self._sec_per_char, 4),
+                "tier_rtf": {k: round(v, 3) for k, v in self._tier_rtf.items()},
+                "nfe_tiers": dict(NFE_TIERS),
+            }
+
+    def _audio_seconds(self, result) -> float:
+        try:
+            if isinstance(result, np.ndarray):
+                return len(result) / float(self.tts.sample_rate)
+            if isinstance(result, str):
+                return float(sf.info(result).duration)
+        except Exception:
+            pass
+        return 0.0
+
+    def _account(self, batch: list, compute: float):
+        """Attribute batch compute to jobs by audio x steps and update the cost model."""
+        for job in batch:
+            job.audio_sec = self._audio_seconds(job.result)
+        work = sum(j.audio_sec * j.request["nfe_step"] for j in batch)
+        with self._lock:
+            self._pending_work = max(0.0, self._pending_work - sum(j.work for j in batch))
+            if work <= 0:
+                return
+            self._step_cost = _ewma(self._step_cost, compute / work)
+            for job in batch:
+                if job.audio_sec <= 0:
+                    continue
+                job.compute_share = compute * job.audio_sec * job.request["nfe_step"] / work
+                text = job.request.get("text", "")
+                if text:
+                    self._sec_per_char = _ewma(self._sec_per_char, job.audio_sec / len(text))
+                tier = (job.quality.split(":")[-1] or "default")
+                self._tier_rtf[tier] = _ewma(self._tier_rtf.get(tier), job.compute_share / job.audio_sec)
+                metrics.RTF.observe(job.compute_share / job.audio_sec, quality=tier)
+
+    def run(self, request: dict, timeout: Optional[float] = REQUEST_TIMEOUT):
+        """Submit and wait; returns (output_path, timing) or raises the synthesis error.
+
+        On timeout the job is cancelled: skipped if still queued, its output removed if running.
+        """
+        job = self.submit(request)
+        if not job.done.wait(timeout):
+            with self._lock:
+                job.cancelled = not job.done.is_set()
+            if job.cancelled:
+                raise TimeoutError(f"TTS request timed out after {timeout:.0f}s")
+        if isinstance(job.result, Exception):
+            raise job.result
+        return job.result, job.timing()
+
+    def _live(self, job: _Job) -> list:
+        """[job], or [] after releasing a job whose caller already timed out."""
+        with self._lock:
+            if not job.cancelled:
+                return [job]
+            self._pending_work = max(0.0, self._pending_work - job.work)
+        print(f"[TTS][JOB] skipped: caller gave up after {time.perf_counter() - job.t_enqueue:.1f}s in queue")
+        return []
+
+    def _collect(self) -> list:
+        batch = []
+        while not batch:
+            batch = self._live(self._q.get())
+        deadline = time.perf_counter() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch += self._live(self._q.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            t0 = time.perf_counter()
+            for job in batch:
+                job.t_start = t0
+                job.batch_size = len(batch)
+            try:
+                results = self.tts.synthesize_batch([job.request for job in batch])
+            except Exception as e:
+                results = [e] * len(batch)
+            t1 = time.perf_counter()
+            for job, res in zip(batch, results):
+                job.result = res
+                job.t_end = t1
+            try:
+                self._account(batch, t1 - t0)
+            except Exception as e:
+                print(f"[WARN] TTS stats update failed: {e}")
+            for job in batch:
+                t = job.timing()
+                print(f"[TTS][JOB] wait={t['queue_wait_ms']}ms compute={t['compute_ms']}ms batch={len(batch)} "
+                      f"nfe={t['nfe_step']} rtf={t.get('rtf', '-')}")
+                with self._lock:
+                    orphan = job.cancelled
+                    job.done.set()
+                if orphan and isinstance(job.result, str):
+                    try:   # timed out while running: nobody will fetch the wav
+                        os.remove(job.result)
+                    except OSError:
+                        pass
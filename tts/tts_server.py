@@ -1,15 +1,36 @@
 # filename: tts_server.py
-# Startup warmup + auto-warm after /prepare, port 5009, Unity-compatible
-# Now: writes audio to ./out/output.wav on the server and returns a downloadable URL.
+# Startup warmup + auto-warm after /prepare (only for input shapes not yet run), port 5009, Unity-compatible
+# Startup: port binds immediately; TTS and STT load in parallel background threads (/health "ready").
+# Now: writes each /tts result to ./out/tts_<uuid>.wav (atomic rename) and returns a downloadable URL;
+# a background janitor keeps ./out under an age/size budget.
+# Multiple voices: /tts and /prepare take an optional "voice" id (see TTSManager voice registry).
+# /tts/stream: chunked WAV/PCM, one chunk per sentence segment as soon as it is synthesized.
+# /tts goes through one inference worker (bounded queue + micro-batching, 429 when full).
+# /tts "response": "audio" returns the encoded bytes (wav/ogg-opus/mp3) in the body instead of a URL.
+# Synthesized segments are cached on disk (TTSManager.cache); "cache": false in the body bypasses it.
+# STT runs on a pool of faster-whisper replicas (stt_pool.py: queue, 429 when full, short-clip batching).
+# /stt/stream: chunked POST of raw PCM; VAD-cut utterances come back as NDJSON partial/final events.
+# "quality": fast/balanced/hq picks the NFE step tier; "adaptive" lowers it under load, /tts/stream
+# included (timing has rtf), and for long texts only when TTS_MAX_COMPUTE_SEC > 0; any other value is a 400.
+# GET /metrics: Prometheus text format (stage latency histograms, RTF, audio seconds, queues, caches).
 
-import os, io, json, traceback
+import os, io, json, time, uuid, struct, threading, traceback
 from pathlib import Path
+from typing import Optional
 
+import numpy as np
 import torch, soundfile as sf
-from flask import Flask, request, jsonify, Response, send_from_directory
+from flask import Flask, request, jsonify, Response, send_from_directory, stream_with_context
 from werkzeug.utils import secure_filename
+from werkzeug.exceptions import RequestEntityTooLarge
 
-from TTS_Manager import TTSManager
+from TTS_Manager import TTSManager, NFE_TIERS, check_voice_id
+from tts_scheduler import TTSScheduler
+from queue_errors import QueueFull
+from stt_stream import StreamingTranscriber, STT_SR
+from stt_pool import STTPool, STT_CPU_THREADS
+from stt_audio import decode_to_16k, AudioTooLong, StreamResampler, STT_MAX_UPLOAD_MB
+import tts_metrics as metrics
 
 # ===== Config =====
 PORT         = int(os.getenv("PORT", "5009"))
@@ -17,12 +38,33 @@ PORT         = int(os.getenv("PORT", "5009"))
 OUTPUT_PATH  = os.environ.get("OUT_WAV", str(Path.cwd() / "out" / "output.wav"))
 AUDIO_DIR    = Path(OUTPUT_PATH).parent
 AUDIO_DIR.mkdir(parents=True, exist_ok=True)
+OUT_PREFIX   = "tts_"
+# Retention for AUDIO_DIR: files older than OUT_MAX_AGE_SEC, then oldest first above OUT_MAX_MB
+OUT_MAX_AGE_SEC = float(os.getenv("OUT_MAX_AGE_SEC", "900"))
+OUT_MAX_MB      = float(os.getenv("OUT_MAX_MB", "256"))
+OUT_JANITOR_SEC = float(os.getenv("OUT_JANITOR_SEC", "60"))
 UPLOAD_DIR   = Path(os.getenv("UPLOAD_DIR", str(Path.cwd() / "_uploads")))
 DEFAULT_REF  = os.environ.get("REF_WAV", r"C:\Users\wtf81\OneDrive\文件\TTS\晴輝阿姨.aac")
 DEFAULT_REF_TEXT = os.environ.get("DEFAULT_REF_TEXT", "")
 
 # Optional: override the public base for audio URLs (e.g., https://tts.example.com/audio)
 AUDIO_URL_BASE = os.environ.get("AUDIO_URL_BASE", "")
+# /tts default response: "url" (write file, return JSON with URL) or "audio" (bytes in the body)
+TTS_RESPONSE   = os.environ.get("TTS_RESPONSE", "url").lower()
+TTS_AUDIO_FMT  = os.environ.get("TTS_AUDIO_FORMAT", "wav").lower()
+# format -> (soundfile format, subtype, mimetype); ogg/mp3 need libsndfile >= 1.1
+AUDIO_FORMATS = {
+    "wav": ("WAV", "PCM_16", "audio/wav"),
+    "ogg": ("OGG", "OPUS", "audio/ogg"),
+    "opus": ("OGG", "OPUS", "audio/ogg"),
+    "mp3": ("MP3", "MPEG_LAYER_III", "audio/mpeg"),
+}
+
+# Default quality tier for requests without "quality": "" (use F5TTS_NFE), fast|balanced|hq|adaptive
+TTS_QUALITY = os.environ.get("TTS_QUALITY", "").lower()
+if TTS_QUALITY not in ("", "adaptive", *NFE_TIERS):
+    print(f"[WARN] unknown TTS_QUALITY={TTS_QUALITY!r}, using F5TTS_NFE")
+    TTS_QUALITY = ""
 
 # Warmup controls
 WARMUP_TEXT  = os.environ.get("WARMUP_TEXT", "嗨")
@@ -32,6 +74,8 @@ WARMUP_ENABLE = os.environ.get("WARMUP_ENABLE", "1") == "1"
 WHISPER_SIZE   = os.environ.get("WHISPER_SIZE", "small")
 WHISPER_DEVICE = os.environ.get("WHISPER_DEVICE", ("cuda" if torch.cuda.is_available() else "cpu"))
 WHISPER_TYPE   = os.environ.get("WHISPER_TYPE", "float32")
+# "background": load at startup in parallel with TTS; "lazy": load on the first /stt request
+STT_PRELOAD    = os.environ.get("STT_PRELOAD", "background").lower()
 
 try:
     from faster_whisper import WhisperModel
@@ -40,53 +84,158 @@ except Exception:
 
 app = Flask(__name__)
 
-def _do_warmup(tts: TTSManager, text: str = "嗨"):
-    """Synthesize a tiny clip to trigger kernel compilation & caching."""
+_last_output = OUTPUT_PATH   # most recent /tts file (for /health "output_path"/"audio_url")
+
+def _new_output_path() -> str:
+    return str(AUDIO_DIR / f"{OUT_PREFIX}{uuid.uuid4().hex}.wav")
+
+def _audio_url(name: str) -> str:
+    if AUDIO_URL_BASE:
+        return AUDIO_URL_BASE.rstrip("/") + "/" + name
+    return f"{request.scheme}://{request.host}/audio/{name}"
+
+def _clean_outputs(now: float = None) -> int:
+    """Apply the age/size retention to AUDIO_DIR; returns the number of files removed."""
+    now = now or time.time()
+    files = []
+    for p in AUDIO_DIR.iterdir():
+        name = p.name
+        # our outputs and stale temp files from interrupted writes
+        if not (name.startswith(OUT_PREFIX) or (name.startswith(".") and name.endswith(".part"))):
+            continue
+        try:
+            st = p.stat()
+        except OSError:
+            continue
+        if name.endswith(".part") and now - st.st_mtime <= OUT_MAX_AGE_SEC:
+            continue   # possibly still being written
+        files.append((st.st_mtime, st.st_size, p))
+    files.sort()
+    removed = 0
+    total = sum(size for _, size, _ in files)
+    budget = OUT_MAX_MB * 1024 * 1024
+    for mtime, size, p in files:
+        if now - mtime <= OUT_MAX_AGE_SEC and (budget <= 0 or total <= budget):
+            break
+        try:
+            p.unlink()
+            removed += 1
+            total -= size
+        except OSError:
+            pass
+    return removed
+
+def _janitor_loop():
+    while True:
+        time.sleep(OUT_JANITOR_SEC)
+        try:
+            n = _clean_outputs()
+            if n:
+                print(f"[TTS][JANITOR] removed {n} old output file(s)")
+        except Exception as e:
+            print(f"[WARN] janitor failed: {e}")
+
+if OUT_JANITOR_SEC > 0:
+    threading.Thread(target=_janitor_loop, name="out-janitor", daemon=True).start()
+
+def _do_warmup(tts: TTSManager, text: str = "嗨") -> bool:
+    """Warm kernels for the active voice in memory, only if its input shape is still cold.
+
+    Returns True if a synthesis pass ran (cold), False if skipped or disabled.
+    """
     if not WARMUP_ENABLE:
-        return
+        return False
     try:
-        tmp = UPLOAD_DIR / "_warmup.wav"
-        UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
-        tts.synthesize(
-            text=text or "嗨",
-            output_path=str(tmp),
+        t0 = time.perf_counter()
+        ran = tts.warmup(
+            text or "嗨",
             speed=float(os.getenv("F5TTS_DEFAULT_SPEED", "0.90")),
-            nfe_step=int(os.getenv("F5TTS_NFE", "16")),
+            nfe_step=NFE_TIERS["fast"],   # step count does not change kernel shapes
             cross_fade_sec=float(os.getenv("F5TTS_XFADE", "0.12")),
             pause_ms=int(os.getenv("F5TTS_PAUSE_MS", "0")),
             strip_meta=True,
-            taiwan_accent=True,
-            remove_silence=False,
             seed=1,
             ref_text=os.environ.get("DEFAULT_REF_TEXT", ""),
         )
-        try:
-            tmp.unlink(missing_ok=True)
-        except Exception:
-            pass
-        print("Warmup OK.")
+        print(f"Warmup OK ({time.perf_counter() - t0:.2f}s)." if ran else "Warmup skipped (already warm).")
+        return ran
     except Exception as e:
         print(f"[WARN] warmup failed: {e}")
+        return False
+
+# ===== Startup =====
+# Models load in background threads so the port binds at once; /health reports each component.
+# tts/scheduler/stt_pool stay None until their component is "ready".
+tts: Optional[TTSManager] = None
+scheduler: Optional[TTSScheduler] = None
+stt_pool: Optional[STTPool] = None
+_BOOT_T0 = time.perf_counter()
+_components = {name: dict(state="pending", seconds=None, error=None) for name in ("tts", "stt")}
+_stt_lock = threading.Lock()
 
-# ===== Init TTS =====
-tts = TTSManager()
-if DEFAULT_REF and os.path.isfile(DEFAULT_REF):
+def _boot(name: str, fn):
+    c = _components[name]
+    c["state"] = "loading"
+    t0 = time.perf_counter()
     try:
-        tts.prepare_reference(DEFAULT_REF, ref_text=DEFAULT_REF_TEXT)
-        print(f"OK TTS ref ready: {DEFAULT_REF}")
-        _do_warmup(tts, WARMUP_TEXT)
+        fn()
+        c["state"] = "ready"
     except Exception as e:
-        print(f"[WARN] ref load failed: {e}")
-else:
-    print("[WARN] REF_WAV not set. POST /prepare or set env REF_WAV.")
-
-# ===== Init STT =====
-if WhisperModel is not None:
-    print(f"OK STT: faster-whisper/{WHISPER_SIZE} on {WHISPER_DEVICE} ({WHISPER_TYPE})")
-    stt_model = WhisperModel(WHISPER_SIZE, device=WHISPER_DEVICE, compute_type=WHISPER_TYPE)
-else:
-    print("WARN: faster-whisper not installed, /stt will error")
-    stt_model = None
+        traceback.print_exc()
+        c["state"], c["error"] = "error", repr(e)
+    c["seconds"] = round(time.perf_counter() - t0, 2)
+    print(f"[BOOT] {name} {c['state']} in {c['seconds']}s")
+    if all(x["state"] in ("ready", "error") or (n == "stt" and STT_PRELOAD == "lazy")
+           for n, x in _components.items()):
+        print(f"[BOOT] time-to-ready {time.perf_counter() - _BOOT_T0:.1f}s")
+
+def _init_tts():
+    global tts, scheduler
+    m = TTSManager()
+    if DEFAULT_REF and os.path.isfile(DEFAULT_REF):
+        try:
+            m.prepare_reference(DEFAULT_REF, ref_text=DEFAULT_REF_TEXT)
+            print(f"OK TTS ref ready: {DEFAULT_REF}")
+            _do_warmup(m, WARMUP_TEXT)
+        except Exception as e:
+            print(f"[WARN] ref load failed: {e}")
+    else:
+        print("[WARN] REF_WAV not set. POST /prepare or set env REF_WAV.")
+    scheduler = TTSScheduler(m)
+    tts = m
+
+def _init_stt():
+    global stt_pool
+    if WhisperModel is None:
+        raise RuntimeError("faster-whisper not installed, /stt will error")
+    stt_pool = STTPool(lambda: WhisperModel(WHISPER_SIZE, device=WHISPER_DEVICE, compute_type=WHISPER_TYPE,
+                                            cpu_threads=STT_CPU_THREADS, num_workers=1))
+    print(f"OK STT: faster-whisper/{WHISPER_SIZE} on {WHISPER_DEVICE} ({WHISPER_TYPE})"
+          f" x{stt_pool.replicas} replica(s)")
+
+def _get_stt():
+    """The whisper pool, loading it on first use when STT_PRELOAD=lazy (None if unavailable)."""
+    if stt_pool is None and _components["stt"]["state"] == "pending":
+        with _stt_lock:
+            if _components["stt"]["state"] == "pending":
+                _boot("stt", _init_stt)
+    return stt_pool
+
+threading.Thread(target=_boot, args=("tts", _init_tts), name="boot-tts", daemon=True).start()
+if STT_PRELOAD != "lazy":
+    threading.Thread(target=_boot, args=("stt", _init_stt), name="boot-stt", daemon=True).start()
+
+# endpoints that need the TTS model; answered with 503 until it is loaded
+_TTS_ENDPOINTS = {"voices", "prepare", "tts_route", "tts_stream_route", "prepare_notify"}
+
+@app.before_request
+def _require_components():
+    if request.endpoint in _TTS_ENDPOINTS and tts is None:
+        c = _components["tts"]
+        resp = jsonify({"ok": False, "error": f"TTS not ready ({c['state']})", "detail": c["error"]})
+        resp.headers["Retry-After"] = "5"
+        return resp, 503
+    return None
 
 def _normalize_text(payload) -> str:
     text = (payload or {}).get("text", "")
@@ -105,25 +254,53 @@ def _normalize_text(payload) -> str:
 
 @app.get("/health")
 def health():
-    # Also show the public URL where audio is served
-    name = Path(OUTPUT_PATH).name
-    if AUDIO_URL_BASE:
-        audio_url = AUDIO_URL_BASE.rstrip("/") + "/" + name
-    else:
-        audio_url = f"{request.scheme}://{request.host}/audio/{name}"
+    # Also show the public URL where audio is served: latest output, plus the base for any file
     return jsonify({
         "ok": True,
-        "tts_prepared": tts.prepared,
+        "ready": {name: dict(c) for name, c in _components.items()},
+        "uptime_sec": round(time.perf_counter() - _BOOT_T0, 1),
+        "tts_prepared": bool(tts and tts.prepared),
+        "voices": tts.list_voices() if tts else None,
         "stt_model": f"faster-whisper/{WHISPER_SIZE}",
         "stt_device": WHISPER_DEVICE,
-        "output_path": OUTPUT_PATH,
-        "audio_url": audio_url,
-        "warmup": dict(enabled=WARMUP_ENABLE, text=WARMUP_TEXT)
+        "stt_pool": stt_pool.stats() if stt_pool else None,
+        "output_path": _last_output,
+        "audio_url": _audio_url(Path(_last_output).name),
+        "output_dir": str(AUDIO_DIR),
+        "audio_url_base": _audio_url(""),
+        "tts_response": dict(default=TTS_RESPONSE, format=TTS_AUDIO_FMT, formats=sorted(AUDIO_FORMATS)),
+        "output_retention": dict(max_age_sec=OUT_MAX_AGE_SEC, max_mb=OUT_MAX_MB),
+        "warmup": dict(enabled=WARMUP_ENABLE, text=WARMUP_TEXT, warm_shapes=tts.warm_shapes if tts else 0),
+        "queue": scheduler.stats() if scheduler else None,
+        "cache": tts.cache.stats() if tts else None,
     })
 
+@app.get("/metrics")
+def metrics_route():
+    """Prometheus scrape; queue/cache gauges are read from their owners at scrape time."""
+    if scheduler:
+        metrics.QUEUE_DEPTH.set(scheduler.depth)
+        metrics.QUEUE_CAP.set(scheduler.capacity)
+    if tts:
+        c = tts.cache.stats()
+        t = tts.text_cache_info()
+        for name, hits, misses in (("segment", c["hits"], c["misses"]), ("text", t.hits, t.misses)):
+            metrics.CACHE_HITS.set(hits, cache=name)
+            metrics.CACHE_MISSES.set(misses, cache=name)
+            metrics.CACHE_RATIO.set(hits / (hits + misses) if hits + misses else 0.0, cache=name)
+        metrics.WARM_SHAPES.set(tts.warm_shapes)
+    if stt_pool:
+        metrics.STT_QUEUE_DEPTH.set(stt_pool.depth)
+        metrics.STT_QUEUE_CAP.set(stt_pool.stats()["capacity"])
+    return Response(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/voices")
+def voices():
+    return jsonify({"ok": True, **tts.list_voices()})
+
 @app.post("/prepare")
 def prepare():
-    """Prepare or switch reference audio; auto-warm afterwards."""
+    """Prepare or switch reference audio; auto-warm afterwards. Optional "voice" names the voice id."""
     try:
         UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 
@@ -132,71 +309,209 @@ def prepare():
             path = UPLOAD_DIR / secure_filename(f.filename or "ref.wav")
             f.save(path)
             ref_text = request.form.get("ref_text", "")
-            tts.prepare_reference(str(path), ref_text=ref_text)
-            _do_warmup(tts, WARMUP_TEXT)
-            print(f"[TTS][PREPARED] ref_wav={path} ref_text_used={bool(ref_text)}")
-            return jsonify({"ok": True, "ref_wav": str(path), "ref_text_used": bool(ref_text)})
+            voice_id = tts.prepare_reference(str(path), ref_text=ref_text,
+                                             voice_id=request.form.get("voice") or None)
+            warmed = _do_warmup(tts, WARMUP_TEXT)
+            print(f"[TTS][PREPARED] voice={voice_id} ref_wav={path} ref_text_used={bool(ref_text)} warmed={warmed}")
+            return jsonify({"ok": True, "voice": voice_id, "ref_wav": str(path), "ref_text_used": bool(ref_text),
+                            "warmed": warmed})
 
         data = request.get_json(silent=True) or {}
         wav_path = data.get("wav_path")
         ref_text = data.get("ref_text", "")
+        voice_id = data.get("voice") or None
+        if not wav_path and voice_id:
+            # switch to a registered voice or one found in the voices directory
+            tts.use_voice(voice_id)
+            warmed = _do_warmup(tts, WARMUP_TEXT)
+            print(f"[TTS][PREPARED] voice={voice_id} (registry) warmed={warmed}")
+            return jsonify({"ok": True, "voice": voice_id, "ref_wav": None, "ref_text_used": False,
+                            "warmed": warmed})
         if not wav_path or not os.path.isfile(wav_path):
             return jsonify({"ok": False, "error": "缺少或無效的參考音"}), 400
-        tts.prepare_reference(wav_path, ref_text=ref_text)
-        _do_warmup(tts, WARMUP_TEXT)
-        print(f"[TTS][PREPARED] ref_wav={wav_path} ref_text_used={bool(ref_text)}")
-        return jsonify({"ok": True, "ref_wav": wav_path, "ref_text_used": bool(ref_text)})
+        voice_id = tts.prepare_reference(wav_path, ref_text=ref_text, voice_id=voice_id)
+        warmed = _do_warmup(tts, WARMUP_TEXT)
+        print(f"[TTS][PREPARED] voice={voice_id} ref_wav={wav_path} ref_text_used={bool(ref_text)} warmed={warmed}")
+        return jsonify({"ok": True, "voice": voice_id, "ref_wav": wav_path, "ref_text_used": bool(ref_text),
+                        "warmed": warmed})
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+    except KeyError as e:
+        return jsonify({"ok": False, "error": str(e)}), 404
     except Exception as e:
         traceback.print_exc()
         return jsonify({"ok": False, "error": repr(e)}), 400
 
 
+def _ensure_ready(voice):
+    """If not prepared, try auto-prepare with DEFAULT_REF once. Returns an error response or None."""
+    if not tts.prepared and voice is None:
+        if DEFAULT_REF and os.path.isfile(DEFAULT_REF):
+            tts.prepare_reference(DEFAULT_REF, ref_text=DEFAULT_REF_TEXT)
+            _do_warmup(tts, WARMUP_TEXT)
+        else:
+            return jsonify({"ok": False, "error": "no reference voice: set REF_WAV or POST /prepare"}), 400
+    return None
+
+def _synth_kwargs(data: dict) -> dict:
+    """Per-request synthesis options shared by /tts and /tts/stream (ValueError on a bad voice id)."""
+    voice = str(data.get("voice") or "").strip() or None
+    return dict(
+        speed=float(os.getenv("F5TTS_DEFAULT_SPEED", "0.90")),
+        nfe_step=int(os.getenv("F5TTS_NFE", "16")),
+        cross_fade_sec=float(os.getenv("F5TTS_XFADE", "0.12")),
+        pause_ms=int(os.getenv("F5TTS_PAUSE_MS", "400")),
+        strip_meta=os.getenv("F5TTS_STRIP_META", "true").lower()=="true",
+        seed=int(data.get("seed", -1)),
+        ref_text=str(data.get("ref_text", "") or ""),
+        voice=voice and check_voice_id(voice),
+        use_cache=str(data.get("cache", "true")).lower() != "false",
+        quality=str(data.get("quality") or TTS_QUALITY).lower(),
+    )
+
+def _encode_audio(wave, sr: int, fmt: str) -> bytes:
+    """Encode a float waveform in memory (no temp file)."""
+    sf_format, subtype, _ = AUDIO_FORMATS[fmt]
+    buf = io.BytesIO()
+    sf.write(buf, wave, sr, format=sf_format, subtype=subtype)
+    return buf.getvalue()
+
 @app.post("/tts")
 def tts_route():
-    """Unity JSON {text: '...'} -> synthesize to OUTPUT_PATH and return a URL to fetch it."""
+    """Unity JSON {text: '...'} -> synthesize to a unique file in AUDIO_DIR and return a URL to fetch it.
+
+    With "response": "audio" (or TTS_RESPONSE=audio) the audio is returned directly in the body,
+    encoded in memory as "format": wav (default) | ogg (Opus) | mp3; timing goes in X-TTS-* headers.
+    """
+    global _last_output
     try:
         data = request.get_json(silent=True) or {}
         text = _normalize_text(data)
         if not text:
             return jsonify({"ok": False, "error": "text is empty"}), 400
 
-        # If not prepared, try auto-prepare with DEFAULT_REF once
-        if not tts.prepared:
-            if DEFAULT_REF and os.path.isfile(DEFAULT_REF):
-                tts.prepare_reference(DEFAULT_REF, ref_text=DEFAULT_REF_TEXT)
-                _do_warmup(tts, WARMUP_TEXT)
-            else:
-                return jsonify({"ok": False, "error": "no reference voice: set REF_WAV or POST /prepare"}), 400
+        kwargs = _synth_kwargs(data)
+        err = _ensure_ready(kwargs["voice"])
+        if err is not None:
+            return err
 
-        out_path = OUTPUT_PATH
-        Path(out_path).parent.mkdir(parents=True, exist_ok=True)
+        if str(data.get("response") or TTS_RESPONSE).lower() == "audio":
+            fmt = str(data.get("format") or TTS_AUDIO_FMT).lower()
+            if fmt not in AUDIO_FORMATS:
+                return jsonify({"ok": False, "error": f"unsupported format: {fmt}"}), 400
+            wave, timing = scheduler.run(dict(text=text, **kwargs))
+            body = _encode_audio(wave, tts.sample_rate, fmt)
+            headers = {"X-Sample-Rate": str(tts.sample_rate), "Cache-Control": "no-store"}
+            headers.update({f"X-TTS-{k.replace('_', '-')}": str(v) for k, v in timing.items()})
+            return Response(body, mimetype=AUDIO_FORMATS[fmt][2], headers=headers)
 
-        tts.synthesize(
-            text=text,
-            output_path=out_path,
-            speed=float(os.getenv("F5TTS_DEFAULT_SPEED", "0.90")),
-            nfe_step=int(os.getenv("F5TTS_NFE", "16")),
-            cross_fade_sec=float(os.getenv("F5TTS_XFADE", "0.12")),
-            pause_ms=int(os.getenv("F5TTS_PAUSE_MS", "400")),
-            strip_meta=os.getenv("F5TTS_STRIP_META", "true").lower()=="true",
-            taiwan_accent=True,
-            remove_silence=False,
-            seed=int(data.get("seed", -1)),
-            ref_text=str(data.get("ref_text", "") or ""),
-        )
+        out_path, timing = scheduler.run(dict(text=text, output_path=_new_output_path(), **kwargs))
+        _last_output = out_path
 
         # Build a downloadable URL for Unity to fetch the wav
-        name = Path(out_path).name
-        if AUDIO_URL_BASE:
-            audio_url = AUDIO_URL_BASE.rstrip("/") + "/" + name
-        else:
-            audio_url = f"{request.scheme}://{request.host}/audio/{name}"
+        audio_url = _audio_url(Path(out_path).name)
+
+        return jsonify({"ok": True, "output": out_path, "url": audio_url, "timing": timing})
+    except QueueFull as e:
+        resp = jsonify({"ok": False, "error": str(e), "queue_depth": scheduler.depth})
+        resp.headers["Retry-After"] = "1"
+        return resp, 429
+    except TimeoutError as e:
+        return jsonify({"ok": False, "error": str(e)}), 504
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+    except KeyError as e:
+        return jsonify({"ok": False, "error": str(e)}), 404
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({"ok": False, "error": repr(e)}), 500
+
+def _wav_stream_header(sr: int, channels: int = 1, bits: int = 16) -> bytes:
+    """WAV header with 'unknown' (0xFFFFFFFF) sizes, as used for live PCM streams."""
+    block = channels * bits // 8
+    return (b"RIFF" + struct.pack("<I", 0xFFFFFFFF) + b"WAVE"
+            + b"fmt " + struct.pack("<IHHIIHH", 16, 1, channels, sr, sr * block, block, bits)
+            + b"data" + struct.pack("<I", 0xFFFFFFFF))
+
+def _pcm16(wave) -> bytes:
+    return (np.clip(wave, -1.0, 1.0) * 32767.0).astype("<i2").tobytes()
 
-        return jsonify({"ok": True, "output": out_path, "url": audio_url})
+@app.post("/tts/stream")
+def tts_stream_route():
+    """Same JSON as /tts; streams audio per segment as it is generated (chunked transfer).
+
+    ?format=wav (default): streaming WAV (16-bit PCM, unknown length header)
+    ?format=pcm: raw s16le mono; sample rate in the X-Sample-Rate header
+    Admitted against the same capacity as /tts (429 when full); X-TTS-First-Chunk-Ms reports
+    time to the first segment, the full timing is logged when the stream ends.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        text = _normalize_text(data)
+        if not text:
+            return jsonify({"ok": False, "error": "text is empty"}), 400
+        kwargs = _synth_kwargs(data)
+        err = _ensure_ready(kwargs["voice"])
+        if err is not None:
+            return err
+        fmt = (request.args.get("format") or data.get("format") or "wav").lower()
+        sr = tts.sample_rate
+        # resolves "quality" against the text and current load; 429 when over TTS_QUEUE_MAX
+        job = scheduler.open_stream(dict(text=text, **kwargs))
+        kwargs.pop("quality", None)
+        kwargs["nfe_step"] = job.request["nfe_step"]
+        try:
+            chunks = tts.synthesize_stream(text, **kwargs)
+            first = next(chunks)  # surface errors (bad voice, empty text) before streaming starts
+        except BaseException:
+            scheduler.close_stream(job, 0.0)
+            raise
+        job.t_first = time.perf_counter()
+    except QueueFull as e:
+        resp = jsonify({"ok": False, "error": str(e), "queue_depth": scheduler.depth})
+        resp.headers["Retry-After"] = "1"
+        return resp, 429
+    except StopIteration:
+        return jsonify({"ok": False, "error": "no audio generated"}), 500
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+    except KeyError as e:
+        return jsonify({"ok": False, "error": str(e)}), 404
     except Exception as e:
         traceback.print_exc()
         return jsonify({"ok": False, "error": repr(e)}), 500
 
+    sent = [len(first)]   # samples handed to the client
+
+    def finish():
+        if job.t_end:   # once: generator end or response close, whichever comes first
+            return
+        t = scheduler.close_stream(job, sent[0] / sr)
+        print(f"[TTS][STREAM] first={t['first_chunk_ms']}ms total={t['compute_ms']}ms "
+              f"audio={t.get('audio_sec', 0)}s nfe={t['nfe_step']} rtf={t.get('rtf', '-')}")
+
+    def generate():
+        try:
+            if fmt != "pcm":
+                yield _wav_stream_header(sr)
+            yield _pcm16(first)
+            for w in chunks:
+                sent[0] += len(w)
+                yield _pcm16(w)
+        except Exception:
+            traceback.print_exc()   # headers are already sent; just end the stream
+        finally:
+            finish()
+
+    first_timing = job.timing()
+    headers = {"X-Sample-Rate": str(sr), "Cache-Control": "no-store"}
+    headers.update({f"X-TTS-{k.replace('_', '-')}": str(first_timing[k])
+                    for k in ("first_chunk_ms", "quality", "nfe_step")})
+    mimetype = "audio/L16" if fmt == "pcm" else "audio/wav"
+    resp = Response(stream_with_context(generate()), mimetype=mimetype, headers=headers)
+    resp.call_on_close(finish)   # also releases the slot if the client leaves before the first chunk
+    return resp
+
 # 需要：from flask import request, jsonify  已經有就不用再加
 @app.post("/prepare-notify")
 def prepare_notify():
@@ -207,30 +522,124 @@ def prepare_notify():
     mtime = data.get("mtime")
 
     print(f"[TTS][SWITCHED] voice={voice_name} src={source_path} md5={md5} mtime={mtime}")
-    reload_reference(force=True)     # ← 立即重載
-    _do_warmup(tts, WARMUP_TEXT)     # ← 立刻做一次暖機，之後就用新聲音
-    return jsonify({"ok": True})
+    try:
+        # 立即重載：有來源檔就以它準備（同檔同 md5 會直接命中快取），否則從 voices 目錄找
+        if source_path and os.path.isfile(source_path):
+            voice_id = tts.prepare_reference(source_path, voice_id=voice_name or None)
+        elif voice_name:
+            voice_id = tts.use_voice(voice_name)
+        else:
+            return jsonify({"ok": False, "error": "缺少 voice_name 或 source_path"}), 400
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+    except KeyError as e:
+        return jsonify({"ok": False, "error": str(e)}), 404
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({"ok": False, "error": repr(e)}), 400
+    warmed = _do_warmup(tts, WARMUP_TEXT)     # ← 形狀還沒跑過才暖機，已熱就直接用新聲音
+    return jsonify({"ok": True, "voice": voice_id, "warmed": warmed})
+
+def _transcribe_text(pool: STTPool, audio, endpoint: str = "stt") -> str:
+    with metrics.STT_TRANSCRIBE_SEC.time(endpoint=endpoint):
+        return pool.transcribe(audio)
+
+def _json_error(msg: str, status: int, **headers):
+    return Response(json.dumps({"ok": False, "error": msg}, ensure_ascii=False),
+                    content_type="application/json; charset=utf-8", status=status, headers=headers)
+
+def _stt_unavailable():
+    if _components["stt"]["state"] in ("pending", "loading"):
+        return _json_error("STT 模型載入中", 503, **{"Retry-After": "5"})
+    return _json_error("faster-whisper 未安裝", 500)
 
 @app.post("/stt")
 def stt_route():
+    """Multipart "audio" file -> text. Decoded straight from the upload to float32 16 kHz mono."""
     try:
-        if stt_model is None:
-            return Response(json.dumps({"ok": False, "error": "faster-whisper 未安裝"}),
-                            content_type="application/json; charset=utf-8", status=500)
+        # cap the body for this route only (/stt/stream is unbounded): werkzeug rejects a larger
+        # Content-Length up front and stops chunked uploads once they pass it, before spooling
+        request.max_content_length = int(STT_MAX_UPLOAD_MB * 1024 * 1024)
+        pool = _get_stt()
+        if pool is None:
+            return _stt_unavailable()
         if "audio" not in request.files:
-            return Response(json.dumps({"ok": False, "error": "缺少 audio 檔"}),
-                            content_type="application/json; charset=utf-8", status=400)
-        data = io.BytesIO(request.files["audio"].read())
-        audio, sr = sf.read(data)
-        segments, info = stt_model.transcribe(audio, beam_size=1, language="zh")
-        text = "".join([seg.text for seg in segments]).strip()
+            return _json_error("缺少 audio 檔", 400)
+        with metrics.STT_DECODE_SEC.time():
+            audio = decode_to_16k(request.files["audio"].stream)
+        metrics.STT_AUDIO_SEC.inc(len(audio) / STT_SR, endpoint="stt")
+        text = _transcribe_text(pool, audio)
         return Response(json.dumps({"ok": True, "text": text}, ensure_ascii=False),
                         content_type="application/json; charset=utf-8")
+    except RequestEntityTooLarge:
+        return _json_error(f"upload too large (limit {STT_MAX_UPLOAD_MB:.0f} MB)", 413)
+    except AudioTooLong as e:
+        return _json_error(str(e), 413)
+    except QueueFull as e:
+        return _json_error(str(e), 429, **{"Retry-After": "1"})
+    except TimeoutError as e:
+        return _json_error(str(e), 504)
     except Exception as e:
         traceback.print_exc()
         return Response(json.dumps({"ok": False, "error": repr(e)}, ensure_ascii=False),
                         content_type="application/json; charset=utf-8", status=500)
 
+STT_STREAM_READ = 3200   # bytes per read from the request body (100 ms of 16 kHz s16le)
+
+@app.post("/stt/stream")
+def stt_stream_route():
+    """Streaming STT: the body is raw mono PCM sent as the user speaks (chunked transfer).
+
+    ?format=s16le (default) | f32le, ?sr=16000 (other rates are resampled on the fly).
+    The response is NDJSON, one event per line as it happens:
+      {"type": "start", "start": s} / {"type": "partial", "text": ...} / {"type": "final", "text": ..., "start", "end"}
+    """
+    pool = _get_stt()
+    if pool is None:
+        return _stt_unavailable()
+    fmt = (request.args.get("format") or "s16le").lower()
+    if fmt not in ("s16le", "f32le"):
+        return jsonify({"ok": False, "error": f"unsupported format: {fmt}"}), 400
+    try:
+        sr = int(request.args.get("sr") or STT_SR)
+    except ValueError:
+        sr = 0
+    if not 1000 <= sr <= 384000:
+        return jsonify({"ok": False, "error": f"invalid sr: {request.args.get('sr')}"}), 400
+    width = 2 if fmt == "s16le" else 4
+    stream = request.stream
+    vad = StreamingTranscriber(lambda audio: _transcribe_text(pool, audio, "stream"))
+    resample = StreamResampler(sr)
+
+    def decode(raw: bytes) -> np.ndarray:
+        x = (np.frombuffer(raw, dtype="<i2").astype(np.float32) / 32768.0 if width == 2
+             else np.frombuffer(raw, dtype="<f4"))
+        metrics.STT_AUDIO_SEC.inc(len(x) / sr, endpoint="stream")
+        return resample(x)
+
+    def generate():
+        carry = b""
+        try:
+            while True:
+                raw = stream.read(STT_STREAM_READ)
+                if not raw:
+                    break
+                raw = carry + raw
+                cut = len(raw) // width * width
+                carry = raw[cut:]
+                for ev in vad.feed(decode(raw[:cut])):
+                    yield json.dumps(ev, ensure_ascii=False) + "\n"
+            for ev in vad.feed(resample(np.zeros(0, dtype=np.float32), last=True)):
+                yield json.dumps(ev, ensure_ascii=False) + "\n"
+            for ev in vad.flush():
+                yield json.dumps(ev, ensure_ascii=False) + "\n"
+        except Exception as e:
+            traceback.print_exc()
+            yield json.dumps({"type": "error", "error": repr(e)}, ensure_ascii=False) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson",
+                    headers={"Cache-Control": "no-store"})
+
 @app.get("/audio/<path:filename>")
 def get_audio(filename):
     # Serve the audio directory read-only
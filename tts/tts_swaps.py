@@ -0,0 +1,101 @@
+# filename: tts_swaps.py
+# swaps.txt pronunciation rules ("pattern => replacement", "re:" prefix for regex), applied in file
+# order. SwapTable compiles runs of independent literal rules into one alternation pass.
+
+import re
+from pathlib import Path
+from typing import List
+
+
+class SwapRule:
+    def __init__(self, pattern: str, replacement: str, is_regex: bool):
+        self.pattern = pattern
+        self.replacement = replacement
+        self.is_regex = is_regex
+        self.rx = re.compile(pattern) if is_regex else re.compile(re.escape(pattern))
+    def apply(self, s: str) -> str:
+        return self.rx.sub(self.replacement, s)
+
+def _overlaps(a: str, b: str) -> bool:
+    """True if a and b can share characters in some text (containment or suffix/prefix overlap)."""
+    if a in b or b in a:
+        return True
+    for n in range(1, min(len(a), len(b))):
+        if a[-n:] == b[:n] or b[-n:] == a[:n]:
+            return True
+    return False
+
+class _SwapStage:
+    """Literal rules applied in one alternation pass: a dict lookup per match."""
+    def __init__(self, rules: List[SwapRule]):
+        self.table = {r.pattern: r.replacement for r in rules}
+        self.rx = re.compile("|".join(re.escape(p) for p in sorted(self.table, key=len, reverse=True)))
+    def apply(self, s: str) -> str:
+        return self.rx.sub(lambda m: self.table[m.group(0)], s)
+
+class SwapTable:
+    """swaps.txt compiled for speed, with the same result as applying the rules one by one.
+
+    Consecutive literal rules are merged into one _SwapStage as long as no pattern can overlap
+    another pattern of the stage or an earlier replacement in it (then pass order cannot
+    matter); regex rules and conflicting literals start a new stage.
+    """
+    def __init__(self, rules: List[SwapRule], mtime: float = 0.0):
+        self.rules = rules
+        self.mtime = mtime
+        self.stages = []
+        cur: List[SwapRule] = []
+        for r in rules:
+            if not r.is_regex and r.pattern == r.replacement:
+                continue   # identity rule: no effect in sequential order either
+            mergeable = not r.is_regex and r.pattern and "\\" not in r.replacement
+            if mergeable and all(not _overlaps(r.pattern, o.pattern) and not _overlaps(r.pattern, o.replacement)
+                                 for o in cur):
+                cur.append(r)
+                continue
+            if cur:
+                self.stages.append(_SwapStage(cur))
+                cur = []
+            if mergeable:
+                cur.append(r)
+            else:
+                self.stages.append(r)
+        if cur:
+            self.stages.append(_SwapStage(cur))
+
+    def __len__(self):
+        return len(self.rules)
+
+    def apply(self, s: str) -> str:
+        for st in self.stages:
+            s = st.apply(s)
+        return s
+
+def load_swaps(path: Path) -> SwapTable:
+    rules = []
+    if not path.is_file():
+        return SwapTable(rules)
+    mtime = path.stat().st_mtime
+    with path.open("r", encoding="utf-8") as f:
+        for raw in f:
+            line = raw.strip()
+            if not line or line.startswith("#") or "=>" not in line:
+                continue
+            pat, rep = line.split("=>", 1)
+            pat = pat.strip()
+            rep = rep.split("#", 1)[0].strip()
+            is_regex = False
+            if pat.startswith("re:"):
+                pat = pat[3:].strip()
+                is_regex = True
+            if rep == "":
+                continue
+            rules.append(SwapRule(pat, rep, is_regex))
+    return SwapTable(rules, mtime)
+
+def apply_swaps(text: str, rules) -> str:
+    """Reference path: every rule in file order (see SwapTable.apply for the compiled one)."""
+    out = text
+    for r in rules:
+        out = r.apply(out)
+    return out